@@ -0,0 +1,120 @@
+"""Time and peak RSS of loading a synthetic --load-dict file with the stdlib and msgspec loaders."""
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+from typing import Iterator
+
+SRC_PATH = pathlib.Path(__file__).resolve().parents[1] / 'src'
+LEGACY_LOADER = '''
+import json
+from huttpy.__main__ import Info, MetaObject, Photo, Post, Video
+
+with open(PATH, 'r', encoding='utf-8') as json_file:
+	content = json.load(json_file)
+
+meta_object = MetaObject(performer=content['performer'], performer_id=int(content['performer_id']))
+
+for k, v in content['photos'].items():
+	meta_object.add_photo(Photo(id=k, data=Info(url=v['url'], description=v['description'])))
+
+for k, v in content['posts'].items():
+	meta_object.add_post(Post(id=k, description=v))
+
+for k, v in content['videos'].items():
+	meta_object.add_video(Video(id=k, data=Info(url=v['url'], description=v['description'])))
+
+count = sum(1 for _ in meta_object.iter_items())
+'''
+MSGSPEC_LOADER = '''
+from huttpy.__main__ import get_local_hutts
+
+count = sum(1 for meta_object in get_local_hutts([PATH]) for _ in meta_object.iter_items())
+'''
+RUNNER = '''
+import resource
+import sys
+import time
+
+PATH = sys.argv[1]
+start = time.perf_counter()
+exec(sys.argv[2])
+elapsed = time.perf_counter() - start
+print(count, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+def parse_bench() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog='bench_load_dict')
+	parser.add_argument('--items', '-n', type=int, nargs='+', default=[10000, 100000], help='Number of photos per synthetic file; posts and videos get a quarter each')
+	parser.add_argument('--json', '-j', action='store_true', default=False, help='Outputs machine-readable results')
+
+	return parser
+
+def iter_samples(items: int) -> Iterator[tuple[str, str, Iterator[tuple[str, object]]]]:
+	# Generated lazily: ru_maxrss survives fork and exec, so a parent holding the samples would inflate every measurement.
+	yield 'posts', 'post', ((f'{i:08x}', f'Post description number {i}') for i in range(items // 4))
+	yield 'photos', 'photo', ((f'{i // 4:08x}-{i % 4}', {'url': f'https://example.com/photos/{i}.jpg', 'description': f'Photo {i}'}) for i in range(items))
+	yield 'videos', 'video', ((f'v{i}', {'url': f'https://example.com/videos/{i}', 'description': f'Video {i}'}) for i in range(items // 4))
+
+def write_samples(directory: str, items: int) -> tuple[str, str]:
+	performer = {'performer': 'bench', 'performer_id': 1}
+	json_path = os.path.join(directory, f'bench-{items}.json')
+	ndjson_path = os.path.join(directory, f'bench-{items}.ndjson')
+
+	with open(json_path, 'w', encoding='utf-8') as json_file:
+		json_file.write(json.dumps(performer)[:-1])
+
+		for media, _, samples in iter_samples(items):
+			json_file.write(f', {json.dumps(media)}: {{')
+			json_file.write(', '.join(f'{json.dumps(k)}: {json.dumps(v)}' for k, v in samples))
+			json_file.write('}')
+
+		json_file.write('}\n')
+
+	with open(ndjson_path, 'w', encoding='utf-8') as ndjson_file:
+		ndjson_file.write(json.dumps({'type': 'performer', **performer}, separators=(',', ':')) + '\n')
+
+		for _, record_type, samples in iter_samples(items):
+			field = 'description' if record_type == 'post' else 'data'
+
+			for k, v in samples:
+				ndjson_file.write(json.dumps({'type': record_type, 'id': k, field: v}, separators=(',', ':')) + '\n')
+
+	return json_path, ndjson_path
+
+def measure(loader: str, path: str, env: dict[str, str]) -> dict[str, float]:
+	output = subprocess.run([sys.executable, '-c', RUNNER, path, loader], env=env, capture_output=True, text=True, check=True).stdout
+	count, elapsed, max_rss = output.split()
+
+	return {'items': int(count), 'seconds': round(float(elapsed), 4), 'max_rss_mb': round(int(max_rss) / 1024, 1)}
+
+def main() -> None:
+	args = parse_bench().parse_args()
+	results = {}
+
+	with tempfile.TemporaryDirectory() as home:
+		env = dict(os.environ, HOME=home, XDG_CONFIG_HOME=os.path.join(home, '.config'), PYTHONPATH=os.pathsep.join(filter(None, [str(SRC_PATH), os.environ.get('PYTHONPATH')])))
+
+		for items in args.items:
+			json_path, ndjson_path = write_samples(home, items)
+			results[str(items)] = {
+				'json_stdlib': measure(LEGACY_LOADER, json_path, env),
+				'json_msgspec': measure(MSGSPEC_LOADER, json_path, env),
+				'ndjson_msgspec': measure(MSGSPEC_LOADER, ndjson_path, env)
+			}
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+
+	else:
+
+		for items, loaders in results.items():
+
+			for name, result in loaders.items():
+				print(f'{items} photos, {name}: {result["seconds"]} s, {result["items"]} items, max RSS {result["max_rss_mb"]} MB')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,138 @@
+"""Parse time per ajax page and end-to-end scrape + download throughput against the local fake hutt server."""
+import argparse
+import json
+import os
+import pathlib
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_hutt import FakeHutt
+
+SRC_PATH = pathlib.Path(__file__).resolve().parents[1] / 'src'
+PERFORMER = 'bench'
+
+def parse_bench() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog='bench_scrape')
+	parser.add_argument('--items', '-n', type=int, nargs='+', default=[1000, 10000, 100000], help='Account sizes (posts) to scrape end to end')
+	parser.add_argument('--per-page', '-p', type=int, default=24, help='Posts per ajax page')
+	parser.add_argument('--runs', '-r', type=int, default=20, help='Timed parses per page type')
+	parser.add_argument('--image-size', type=int, default=4096, help='Bytes per image')
+	parser.add_argument('--video-size', type=int, default=65536, help='Bytes per video')
+	parser.add_argument('--no-download', action='store_true', default=False, help='Only scrape metadata in the end-to-end runs')
+	parser.add_argument('--huttpy-args', default='', help='Extra arguments for the huttpy runs, e.g. "--skip-videos"')
+	parser.add_argument('--json', '-j', action='store_true', default=False, help='Outputs machine-readable results')
+
+	return parser
+
+def write_config(home: str, save_path: str, base_url: str) -> dict[str, str]:
+	config_home = os.path.join(home, '.config')
+	config_folder = os.path.join(config_home, 'huttpy')
+	os.makedirs(config_folder, exist_ok=True)
+
+	with open(os.path.join(config_folder, 'huttpy_config.toml'), 'w', encoding='utf-8') as config_file:
+		config_file.write('\n'.join([
+			f'base_url = "{base_url}"',
+			f'save_path = "{pathlib.Path(save_path).as_posix()}"',
+			'requests_per_second = 0.0',
+			'ajax_requests_per_second = 0.0',
+			'video_requests_per_second = 0.0',
+			'max_concurrency = 8',
+			'video_concurrency = 4',
+			'yt_dlp_in_process = true',
+			''
+		]))
+
+	with open(os.path.join(config_folder, 'huttpy_cookies.txt'), 'w', encoding='utf-8') as cookies_file:
+		cookies_file.write('# Netscape HTTP Cookie File\n')
+
+	return dict(os.environ, HOME=home, XDG_CONFIG_HOME=config_home, PYTHONPATH=os.pathsep.join(filter(None, [str(SRC_PATH), os.environ.get('PYTHONPATH')])))
+
+def max_rss_mb(ru_maxrss: int) -> float:
+	return round(ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def bench_parse(hutt: FakeHutt, runs: int) -> dict[str, dict[str, float]]:
+	from huttpy.__main__ import EXTRACTORS, index_page, parse_page
+
+	results = {}
+
+	for view, extractor in EXTRACTORS.items():
+		html = hutt.render_page(view, 0)
+		timings = []
+
+		for _ in range(runs):
+			start = time.perf_counter()
+			items = extractor(index_page(parse_page(html)))
+			timings.append(time.perf_counter() - start)
+
+		median = statistics.median(timings)
+		results[view] = {'page_bytes': len(html), 'items_per_page': len(items), 'median_ms': round(median * 1000, 3), 'items_per_second': round(len(items) / median, 1)}
+
+	return results
+
+def bench_scrape(items: int, args: argparse.Namespace, home: str) -> dict[str, float]:
+	hutt = FakeHutt(items, args.per_page, args.image_size, args.video_size)
+	server = hutt.serve()
+	save_path = os.path.join(home, f'downloads-{items}')
+	output = os.path.join(home, f'output-{items}')
+	os.makedirs(output, exist_ok=True)
+	env = write_config(home, save_path, f'http://127.0.0.1:{server.server_port}')
+	command = [sys.executable, '-m', 'huttpy', f'http://127.0.0.1:{server.server_port}/{PERFORMER}', '--no-prompts', '--json', '--output', output]
+	command += ['--no-download'] if args.no_download else []
+	command += shlex.split(args.huttpy_args)
+
+	try:
+		start = time.perf_counter()
+		process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		_, status, rusage = os.wait4(process.pid, 0)
+		elapsed = time.perf_counter() - start
+
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	metadata = {}
+
+	for path in pathlib.Path(output).glob('*.json'):
+		metadata = json.loads(path.read_bytes())
+
+	scraped = sum(len(metadata.get(key, {})) for key in ('posts', 'photos', 'videos'))
+	downloaded = [path for path in pathlib.Path(save_path).rglob('*') if path.is_file() and not path.name.startswith('.')]
+
+	return {
+		'exit_code': os.waitstatus_to_exitcode(status),
+		'seconds': round(elapsed, 3),
+		'items_scraped': scraped,
+		'items_per_second': round(scraped / elapsed, 1) if elapsed else 0.0,
+		'files_downloaded': len(downloaded),
+		'megabytes_downloaded': round(sum(path.stat().st_size for path in downloaded) / 1e6, 2),
+		'max_rss_mb': max_rss_mb(rusage.ru_maxrss)
+	}
+
+def main() -> None:
+	args = parse_bench().parse_args()
+	results: dict[str, object] = {'python': sys.version.split()[0]}
+
+	with tempfile.TemporaryDirectory() as home:
+		env = write_config(home, os.path.join(home, 'downloads'), 'http://127.0.0.1:0')
+		os.environ.update(HOME=env['HOME'], XDG_CONFIG_HOME=env['XDG_CONFIG_HOME'])
+		sys.path.insert(0, str(SRC_PATH))
+		results['parse'] = bench_parse(FakeHutt(args.per_page * 10, args.per_page), args.runs)
+		results['scrape'] = {str(items): bench_scrape(items, args, home) for items in args.items}
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+
+	else:
+
+		for view, result in results['parse'].items():
+			print(f'parse {view}: {result["median_ms"]} ms per page of {result["items_per_page"]} items, {result["items_per_second"]} items/s')
+
+		for items, result in results['scrape'].items():
+			print(f'scrape {items} posts: {result["seconds"]} s, {result["items_per_second"]} items/s, {result["files_downloaded"]} files, max RSS {result["max_rss_mb"]} MB, exit code {result["exit_code"]}')
+
+if __name__ == '__main__':
+	main()
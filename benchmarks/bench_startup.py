@@ -0,0 +1,56 @@
+"""Startup time of ``import huttpy.__main__`` and ``huttpy --help`` in fresh interpreters."""
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_PATH = pathlib.Path(__file__).resolve().parents[1] / 'src'
+COMMANDS = {
+	'import': [sys.executable, '-c', 'import huttpy.__main__'],
+	'help': [sys.executable, '-m', 'huttpy', '--help'],
+}
+
+def parse_bench() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog='bench_startup')
+	parser.add_argument('--runs', '-r', type=int, default=10, help='Number of timed runs per command')
+	parser.add_argument('--json', '-j', action='store_true', default=False, help='Outputs machine-readable results')
+
+	return parser
+
+def measure(command: list[str], runs: int, env: dict[str, str]) -> list[float]:
+	timings = []
+
+	for _ in range(runs):
+		start = time.perf_counter()
+		subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+		timings.append((time.perf_counter() - start) * 1000)
+
+	return timings
+
+def main() -> None:
+	args = parse_bench().parse_args()
+	results = {}
+
+	with tempfile.TemporaryDirectory() as home:
+		env = dict(os.environ, HOME=home, XDG_CONFIG_HOME=os.path.join(home, '.config'), PYTHONPATH=os.pathsep.join(filter(None, [str(SRC_PATH), os.environ.get('PYTHONPATH')])))
+
+		for name, command in COMMANDS.items():
+			measure(command, 1, env)
+			timings = measure(command, args.runs, env)
+			results[name] = {'median_ms': round(statistics.median(timings), 2), 'min_ms': round(min(timings), 2), 'runs': args.runs}
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+
+	else:
+
+		for name, result in results.items():
+			print(f'{name}: median {result["median_ms"]} ms, min {result["min_ms"]} ms over {result["runs"]} runs')
+
+if __name__ == '__main__':
+	main()
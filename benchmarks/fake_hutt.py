@@ -0,0 +1,131 @@
+"""Local stand-in for a hutt account: profile page, /hutts/ajax-posts listings and image/video payloads."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import sys
+import threading
+
+PERFORMER_ID = 42
+CAROUSEL_EVERY = 4
+CAROUSEL_SIZE = 3
+
+class QuietServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def handle_error(self, request: object, client_address: object) -> None:
+
+		if not isinstance(sys.exc_info()[1], ConnectionError):
+			super().handle_error(request, client_address)
+
+class FakeHutt:
+	"""Deterministic synthetic account, split into photo, video and text posts."""
+
+	def __init__(self, items: int, per_page: int = 24, image_size: int = 20000, video_size: int = 200000) -> None:
+		self.per_page = max(1, per_page)
+		self.counts = {'photos': items * 6 // 10, 'videos': items // 10, 'view': items - items * 6 // 10 - items // 10}
+		self.image = b'\xff\xd8\xff\xe0' + bytes(range(256)) * (max(0, image_size - 4) // 256) + b'\xff\xd9'
+		self.video = b'\x00\x00\x00\x18ftypmp42' + b'\x00' * max(0, video_size - 12)
+
+	def pages(self, view: str) -> int:
+		return -(-self.counts[view] // self.per_page)
+
+	def render_page(self, view: str, page: int) -> bytes:
+		start = page * self.per_page
+		stop = min(self.counts[view], start + self.per_page)
+		render = {'photos': self.render_photo, 'videos': self.render_video, 'view': self.render_post}[view]
+
+		return ''.join(render(i) for i in range(start, stop)).encode()
+
+	def render_photo(self, i: int) -> str:
+		post_hash = f'p{i:07x}'
+		modal = f'<div class="modal" id="post-modal-{post_hash}"><div class="modal-body"><div class="post-text">Photo post {i} — caption with ünïcode &amp; punctuation!</div></div></div>'
+
+		if i % CAROUSEL_EVERY == CAROUSEL_EVERY - 1:
+			images = ''.join(f'<div class="carousel-item"><img {"src" if n == 1 else "data-src"}="/uploads/middle/{post_hash}-{n}.jpg"></div>' for n in range(1, CAROUSEL_SIZE + 1))
+
+			return f'<div class="huttPost" id="post-{post_hash}"><div id="grid-carousel-{post_hash}"><div class="carousel-inner">{images}</div></div>{modal}</div>'
+
+		return f'<div class="huttPost" id="post-{post_hash}"><div class="grid-item"><img src="/uploads/middle/{post_hash}.jpg"><span class="eventwrap" data-post-hash="{post_hash}"></span></div>{modal}</div>'
+
+	def render_video(self, i: int) -> str:
+		post_hash = f'v{i:07x}'
+
+		return f'<div class="huttPost" id="post-{post_hash}"><div class="modal" id="post-modal-{post_hash}"><div class="modal-body"><div class="post-text">Video post {i}</div><video controls><source src="/videos/middle/{post_hash}.mp4" type="video/mp4"></video></div></div></div>'
+
+	def render_post(self, i: int) -> str:
+		return f'<div class="huttPost" id="post-t{i:07x}"><div class="post-header"><span class="date">2024-01-01</span></div><div class="post-text">Text post {i} with a few more words to clean up.</div></div>'
+
+	def handler(self) -> type[BaseHTTPRequestHandler]:
+		hutt = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+
+			def route(self) -> tuple[bytes, str]:
+				url = urlparse(self.path)
+
+				if url.path == '/hutts/ajax-posts':
+					query = parse_qs(url.query)
+					view = query.get('view', ['view'])[0]
+					page = int(query.get('page', ['0'])[0])
+
+					return (hutt.render_page(view, page) if view in hutt.counts else b''), 'text/html'
+
+				if url.path.endswith('.jpg'):
+					return hutt.image, 'image/jpeg'
+
+				if url.path.endswith('.mp4'):
+					return hutt.video, 'video/mp4'
+
+				return f'<html><body><input type="hidden" name="id" value="{PERFORMER_ID}"></body></html>'.encode(), 'text/html'
+
+			def send(self, include_body: bool) -> None:
+				body, content_type = self.route()
+				self.send_response(200)
+				self.send_header('Content-Type', content_type)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+
+				if include_body:
+					self.wfile.write(body)
+
+			def do_GET(self) -> None:
+				self.send(True)
+
+			def do_HEAD(self) -> None:
+				self.send(False)
+
+			def log_message(self, *args: object) -> None:
+				pass
+
+		return Handler
+
+	def serve(self, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+		server = QuietServer((host, port), self.handler())
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+
+		return server
+
+def parse_fake() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog='fake_hutt')
+	parser.add_argument('--port', '-P', type=int, default=8000, help='Port to listen on')
+	parser.add_argument('--items', '-n', type=int, default=1000, help='Number of posts in the account')
+	parser.add_argument('--per-page', '-p', type=int, default=24, help='Posts per ajax page')
+	parser.add_argument('--image-size', type=int, default=20000, help='Bytes per image')
+	parser.add_argument('--video-size', type=int, default=200000, help='Bytes per video')
+
+	return parser
+
+def main() -> None:
+	args = parse_fake().parse_args()
+	server = FakeHutt(args.items, args.per_page, args.image_size, args.video_size).serve(port=args.port)
+	print(f'Serving {args.items} posts on http://127.0.0.1:{server.server_port}/bench')
+
+	try:
+		threading.Event().wait()
+
+	except KeyboardInterrupt:
+		server.shutdown()
+
+if __name__ == '__main__':
+	main()
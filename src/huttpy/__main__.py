@@ -1,27 +1,40 @@
-from bs4 import BeautifulSoup, Tag
-from dataclasses import dataclass, field
-from datetime import datetime
-from getuseragent import UserAgent #type: ignore
-from http.cookiejar import MozillaCookieJar, LoadError
-from rich.logging import RichHandler
-from rich import print_json
-from urllib.parse import urlparse, urljoin
-from typing import cast, List, Optional, Union
+from __future__ import annotations
+from concurrent.futures import as_completed, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from typing import AbstractSet, Any, cast, Iterable, Iterator, List, Optional, Protocol, TYPE_CHECKING, Union
 import argparse
+import collections
+import contextlib
+import functools
+import hashlib
+import itertools
 import json
 import logging
+import mmap
 import msgspec
 import os
 import pathlib
 import platformdirs
+import queue
 import random
-import requests
+import re
+import sqlite3
 import subprocess
 import sys
+import threading
 import time
 import tomllib
-import tomlkit
 import types
+import unicodedata
+
+if TYPE_CHECKING:
+	from bs4 import BeautifulSoup, Tag
+	from concurrent.futures import ProcessPoolExecutor
+	from http.cookiejar import MozillaCookieJar
+	import cProfile
+	import requests
 
 DEFAULT_CHAR_TABLE = types.MappingProxyType({'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', 'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U', 'à': 'a', 'è': 'e', 'ì': 'i', 'ò': 'o', 'ù': 'u', 'À': 'A', 'È': 'E', 'Ì': 'I', 'Ò': 'O', 'Ù': 'U', 'â': 'a', 'ê': 'e', 'î': 'i', 'ô': 'o', 'û': 'u', 'Â': 'A', 'Ê': 'E', 'Î': 'I', 'Ô': 'O', 'Û': 'U', 'ä': 'a', 'ë': 'e', 'ï': 'i', 'ö': 'o', 'ü': 'u', 'ÿ': 'y', 'Ä': 'A', 'Ë': 'E', 'Ï': 'I', 'Ö': 'O', 'Ü': 'U', 'Ÿ': 'Y', 'ã': 'a', 'Ã': 'A', 'ñ': 'n', 'Ñ': 'N', 'ç': 'c', 'Ç': 'C', 'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'ø': 'o', 'Ø': 'O', 'œ': 'oe', 'Œ': 'OE', 'å': 'a', 'Å': 'A', 'ð': 'd', 'Ð': 'D', 'þ': 'th', 'Þ': 'TH', 'ý': 'y', 'Ý': 'Y', 'đ': 'd', 'Đ': 'D', 'ħ': 'h', 'Ħ': 'H', 'ı': 'i', 'İ': 'I', 'ł': 'l', 'Ł': 'L', 'ń': 'n', 'Ń': 'N', 'ŕ': 'r', 'Ŕ': 'R', 'ś': 's', 'Ś': 'S', 'ź': 'z', 'Ź': 'Z', 'ż': 'z', 'Ż': 'Z', 'š': 's', 'Š': 'S', 'č': 'c', 'Č': 'C', 'ř': 'r', 'Ř': 'R', 'ž': 'z', 'Ž': 'Z', 'ŭ': 'u', 'Ŭ': 'U', 'ğ': 'g', 'Ğ': 'G', 'ş': 's', 'Ş': 'S', 'ĉ': 'c', 'Ĉ': 'C', 'ĝ': 'g', 'Ĝ': 'G', 'ĥ': 'h', 'Ĥ': 'H', 'ĵ': 'j', 'Ĵ': 'J', 'ŝ': 's', 'Ŝ': 'S', 'ő': 'o', 'Ő': 'O', 'ű': 'u', 'Ű': 'U', 'ą': 'a', 'Ą': 'A', 'ę': 'e', 'Ę': 'E', 'ǫ': 'o', 'Ǫ': 'O', 'ų': 'u', 'Ų': 'U', 'ļ': 'l', 'Ļ': 'L', 'ņ': 'n', 'Ņ': 'N', 'ŗ': 'r', 'Ŗ': 'R', 'ķ': 'k', 'Ķ': 'K', 'ā': 'a', 'Ā': 'A', 'ē': 'e', 'Ē': 'E', 'ī': 'i', 'Ī': 'I', 'ū': 'u', 'Ū': 'U', 'ō': 'o', 'Ō': 'O', 'ȳ': 'y', 'Ȳ': 'Y', 'ə': 'e', 'Ə': 'E', '\'': ''})
 USER_DIR = pathlib.Path.home()
@@ -30,11 +43,14 @@ CONFIG_FOLDER = PLATFORMDIRS.user_config_path
 DEFAULT_CONFIGURATION_PATH = CONFIG_FOLDER / 'huttpy_config.toml'
 DEFAULT_SAVE_PATH = PLATFORMDIRS.user_downloads_path / 'huttpy'
 COOKIES_PATH = CONFIG_FOLDER / 'huttpy_cookies.txt'
+PAGE_CACHE_PATH = PLATFORMDIRS.user_cache_path / 'huttpy_pages.sqlite'
+PAGE_CACHE_VERSION = 1
+METADATA_STORE_PATH = PLATFORMDIRS.user_data_path / 'huttpy_metadata.sqlite'
 DEFAULT_ENCODING = 'utf-8'
-logging.basicConfig(level=logging.INFO, format="%(message)s", datefmt="[%X]", handlers=[RichHandler()])
+POST_SUBTREES = re.compile(r'^(grid-carousel|post)-')
+THROTTLE_STATUSES = frozenset({429, 500, 502, 503, 504})
 BROWSER_LIST = ['chrome', 'firefox']
 BROWSER = random.choice(BROWSER_LIST)
-USER_AGENT = UserAgent('chrome', limit=1).list[0]
 
 class DefaultConfig(msgspec.Struct, kw_only=True):
 	base_url: str = 'https://hutt.co'
@@ -43,27 +59,92 @@ class DefaultConfig(msgspec.Struct, kw_only=True):
 	char_limit: int = 48
 	lowercase: bool = False
 	char_table: dict[str, str] = msgspec.field(default_factory=DEFAULT_CHAR_TABLE.copy)
-
-@dataclass
-class Info:
+	requests_per_second: float = 2.0
+	burst: int = 4
+	max_concurrency: int = 4
+	max_retries: int = 4
+	retry_backoff: float = 4.0
+	chunk_size: int = 65536
+	html_parser: str = 'html.parser'
+	restrict_parse: bool = False
+	queue_size: int = 64
+	revalidate_downloads: bool = False
+	video_concurrency: int = 2
+	video_fragments: int = 1
+	video_retries: int = 2
+	yt_dlp_in_process: bool = False
+	performer_concurrency: int = 2
+	pool_connections: int = 8
+	pool_maxsize: int = 32
+	request_timeout: float = 30.0
+	json_indent: int = 4
+	ajax_requests_per_second: float = 1.5
+	video_requests_per_second: float = 0.25
+	max_requests_per_second: float = 8.0
+	min_requests_per_second: float = 0.05
+	rate_increase: float = 0.1
+	rate_decrease: float = 0.5
+	slow_response: float = 5.0
+	page_cache: bool = True
+	page_cache_max_age: float = 7.0
+	page_cache_max_mb: float = 64.0
+	parse_workers: int = 0
+	parse_depth: int = 2
+	metadata_store: bool = False
+
+class Info(msgspec.Struct, gc=False):
 	url: str
 	description: str
 
-@dataclass(kw_only=True)
-class Post:
+class Performer(msgspec.Struct, kw_only=True, gc=False, tag_field='type', tag='performer'):
+	performer: str
+	performer_id: int
+
+class Post(msgspec.Struct, kw_only=True, gc=False, tag_field='type', tag='post'):
 	id: str
 	description: str
 
-@dataclass(kw_only=True)
-class Photo:
+class Photo(msgspec.Struct, kw_only=True, gc=False, tag_field='type', tag='photo'):
 	id: str
 	data: Info
 
-@dataclass(kw_only=True)
-class Video:
+class Video(msgspec.Struct, kw_only=True, gc=False, tag_field='type', tag='video'):
 	id: str
 	data: Info
 
+class PageDone(msgspec.Struct, kw_only=True, gc=False, tag_field='type', tag='page'):
+	media: str
+	page: int
+	last: bool = False
+
+class ItemDone(msgspec.Struct, kw_only=True, gc=False, tag_field='type', tag='done'):
+	media: str
+	id: str
+	ok: bool = True
+
+class HuttDict(msgspec.Struct, gc=False):
+	performer: str
+	performer_id: int
+	photos: dict[str, Info] = msgspec.field(default_factory=dict)
+	posts: dict[str, str] = msgspec.field(default_factory=dict)
+	videos: dict[str, Info] = msgspec.field(default_factory=dict)
+
+class NdjsonHeader(msgspec.Struct, gc=False):
+	type: str = ''
+	id: str = ''
+	performer: str = ''
+	performer_id: int = 0
+
+Item = Union[Post, Photo, Video]
+ItemRow = tuple[Any, ...]
+ITEM_MEDIA: dict[type, str] = {Post: 'posts', Photo: 'photos', Video: 'videos'}
+HUTT_DICT_DECODER = msgspec.json.Decoder(HuttDict, strict=False)
+NDJSON_DECODER = msgspec.json.Decoder(Union[Performer, Post, Photo, Video], strict=False)
+NDJSON_HEADER_DECODER = msgspec.json.Decoder(NdjsonHeader, strict=False)
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+PAGE_ITEMS_DECODER = msgspec.msgpack.Decoder(List[Item])
+JOURNAL_DECODER = msgspec.json.Decoder(Union[Performer, Post, Photo, Video, PageDone, ItemDone])
+
 @dataclass(kw_only=True)
 class MetaObject:
 	performer: str
@@ -71,26 +152,171 @@ class MetaObject:
 	posts: List[Post] = field(default_factory=list)
 	photos: List[Photo] = field(default_factory=list)
 	videos: List[Video] = field(default_factory=list)
+	retain: bool = True
+	_post_ids: set[str] = field(default_factory=set, init=False, repr=False)
+	_photo_ids: set[str] = field(default_factory=set, init=False, repr=False)
+	_photo_hashes: set[str] = field(default_factory=set, init=False, repr=False)
+	_video_ids: set[str] = field(default_factory=set, init=False, repr=False)
+	_sources: List[Iterator[Item]] = field(default_factory=list, init=False, repr=False)
+	_streamed: dict[str, List[str]] = field(default_factory=lambda: {'posts': [], 'photos': [], 'videos': []}, init=False, repr=False)
+
+	def __post_init__(self) -> None:
+		posts, photos, videos = self.posts, self.photos, self.videos
+		self.posts, self.photos, self.videos = [], [], []
+
+		for post in posts:
+			self.add_post(post)
+
+		for photo in photos:
+			self.add_photo(photo)
+
+		for video in videos:
+			self.add_video(video)
+
+	def add_post(self, post: Post) -> bool:
+
+		if post.id in self._post_ids:
+			return False
+
+		self._post_ids.add(post.id)
+		self.keep('posts', post)
+
+		return True
+
+	def add_photo(self, photo: Photo) -> bool:
+
+		post_hash = photo.id.split('-')[0]
+
+		if photo.id in self._photo_ids or (photo.id == post_hash and post_hash in self._photo_hashes):
+			return False
+
+		self._photo_ids.add(photo.id)
+		self._photo_hashes.add(post_hash)
+		self.keep('photos', photo)
+
+		return True
+
+	def add_video(self, video: Video) -> bool:
+
+		if video.id in self._video_ids:
+			return False
+
+		self._video_ids.add(video.id)
+		self.keep('videos', video)
+
+		return True
+
+	def keep(self, media: str, item: 'Item') -> None:
+
+		# Streamed runs keep only the id, so their memory is bounded by the id index rather than by the items.
+		if self.retain:
+			getattr(self, media).append(item)
+
+		else:
+			self._streamed[media].append(item.id)
+
+	def item_ids(self, media: str) -> List[str]:
+		return [item.id for item in getattr(self, media)] + self._streamed[media]
+
+	def count(self, media: str) -> int:
+		return len(getattr(self, media)) + len(self._streamed[media])
+
+	def add(self, item: 'Item') -> bool:
+
+		if isinstance(item, Photo):
+			return self.add_photo(item)
+
+		if isinstance(item, Video):
+			return self.add_video(item)
+
+		return self.add_post(item)
+
+	def add_source(self, source: Iterator[Item]) -> None:
+		self._sources.append(source)
+
+	def iter_items(self) -> Iterator['Item']:
+		yield from self.posts
+		yield from self.photos
+		yield from self.videos
+
+		while self._sources:
+
+			for item in self._sources.pop(0):
+
+				if self.add(item):
+					yield item
+
+	def mark_known(self, posts: Iterable[str] = (), photos: Iterable[str] = (), videos: Iterable[str] = ()) -> None:
+		self._post_ids.update(posts)
+
+		for photo_id in photos:
+			self._photo_ids.add(photo_id)
+			self._photo_hashes.add(photo_id.split('-')[0])
+
+		self._video_ids.update(videos)
+
+	def merge(self, other: 'MetaObject') -> None:
+
+		for post in other.posts:
+			self.add_post(post)
+
+		for photo in other.photos:
+			self.add_photo(photo)
+
+		for video in other.videos:
+			self.add_video(video)
+
+		self._sources.extend(other._sources)
 
 	def asdict(self) -> dict[str, str | object]:
 		return {
 			"performer": self.performer,
 			"performer_id": self.performer_id,
 			"posts": {post.id: post.description for post in self.posts},
-			"photos": {photo.id: photo.data.__dict__ for photo in self.photos},
-			"videos": {video.id: video.data.__dict__ for video in self.videos}
+			"photos": {photo.id: photo.data for photo in self.photos},
+			"videos": {video.id: video.data for video in self.videos}
 		}
 
+@dataclass
+class PageIndex:
+	soup: BeautifulSoup
+	modals: dict[str, Tag] = field(default_factory=dict)
+	carousels: List[tuple[str, Tag]] = field(default_factory=list)
+	posts: List[tuple[str, Tag]] = field(default_factory=list)
+	images: List[Tag] = field(default_factory=list)
+	videos: List[tuple[str, Tag]] = field(default_factory=list)
+	event_wraps: dict[int, str] = field(default_factory=dict)
+	texts: dict[str, str] = field(default_factory=dict)
+
+	def post_text(self, post_hash: str) -> str:
+		from bs4 import Tag
+
+		if post_hash not in self.texts:
+			modal = self.modals.get(post_hash)
+			post_text_element = modal.find(class_='post-text') if modal else None
+			self.texts[post_hash] = detect_text(post_text_element) if isinstance(post_text_element, Tag) else ''
+
+		return self.texts[post_hash]
+
 def parse_huttpy() -> argparse.ArgumentParser:
 	parser=argparse.ArgumentParser(prog='huttpy')
-	parser.add_argument('url', nargs='+', help='url')
+	parser.add_argument('url', nargs='*', help='url')
+	parser.add_argument('--batch', '-b', help='File with one url (or json filepath with --load-dict) per line, use - for stdin (with --no-prompts).')
+	parser.add_argument('--performers', '-c', type=int, default=None, help='Number of performers processed at once (Defaults to config).')
 	parser.add_argument('--json', '-j', action='store_true', default=False, help='Outputs to a json file')
 	parser.add_argument('--load-dict', '-l', action='store_true', default=False, help='Load previously scraped json, will treat positional argument as a json filepath.')
 	parser.add_argument('--no-download', '-n', action='store_true', default=False, help='Scrapes information without downloading')
 	parser.add_argument('--no-prompts', '-p', action='store_true', default=False, help='Does not prompt before downloading.')
 	parser.add_argument('--skip-posts', '-s', action='store_true', default=False, help='Skips downloading/scraping the posts.')
 	parser.add_argument('--skip-photos', '-t', action='store_true', default=False, help='Skips downloading/scraping the photos.')
+	parser.add_argument('--incremental', '-i', action='store_true', default=False, help='Stops paginating at the first page without new posts and only downloads new items.')
 	parser.add_argument('--skip-videos', '-v', action='store_true', default=False, help='Skips downloading/scraping the videos.')
+	parser.add_argument('--resume', '-r', action='store_true', default=False, help='Continues an interrupted run from its journal without refetching finished pages or downloads.')
+	parser.add_argument('--ndjson', '-d', default=None, help='Streams scraped items to an NDJSON file (or a per-performer file inside a directory) as they are found.')
+	parser.add_argument('--store', action='store_true', default=False, help='Upserts scraped items and download results into the local metadata store (Defaults to config).')
+	parser.add_argument('--metrics', '-m', default=None, help='Writes a JSON summary of timings and counters at exit, use - for stdout.')
+	parser.add_argument('--prometheus', default=None, help='Writes the metrics in Prometheus textfile format at exit.')
+	parser.add_argument('--profile', default=None, help='Runs every thread under cProfile and dumps the merged stats to this path.')
 	parser.add_argument('--output', '-o', default=os.path.join(os.path.expanduser('~'), 'Desktop', f'Hutt-Dict-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.json'), help='Specify output path for the metadata only (Defaults to Desktop). Use config for download path.')
 
 	return parser
@@ -103,14 +329,170 @@ def load_toml(config_file: str) -> dict[str, str]:
 	return toml_dict
 
 def save_toml(toml_dict: dict[str, str], toml_path: str) -> None:
+	import tomlkit
 
 	with open(toml_path, 'w') as c:
 		c.write(tomlkit.dumps(toml_dict))
 
 def save_json(content: dict[str, object] | dict[str, str], path: str, indent: int = 4) -> None:
+	data = msgspec.json.encode(content)
+
+	if indent:
+		data = msgspec.json.format(data, indent=indent)
+
+	with open(path, 'wb') as json_file:
+		json_file.write(data)
+
+class NdjsonWriter:
+	"""Appends items to an NDJSON file in batches, one encoded struct per line."""
+
+	lock = threading.Lock()
+
+	def __init__(self, path: str, batch_size: int = 256) -> None:
+		self.path = path
+		self.batch_size = batch_size
+		self.encoder = msgspec.json.Encoder()
+		self.buffer = bytearray()
+		self.pending = 0
 
-	with open(path, 'w', encoding='utf8') as json_file:
-		json.dump(content, json_file, indent=indent)
+	def write(self, item: Union[Performer, Item]) -> None:
+		self.encoder.encode_into(item, self.buffer, -1)
+		self.buffer.extend(b'\n')
+		self.pending += 1
+
+		if self.pending >= self.batch_size:
+			self.flush()
+
+	def flush(self) -> None:
+
+		if not self.buffer:
+			return
+
+		with self.lock, open(self.path, 'ab') as ndjson_file:
+			ndjson_file.write(self.buffer)
+
+		self.buffer.clear()
+		self.pending = 0
+
+class JobJournal(NdjsonWriter):
+	"""Append-only write-ahead log of a performer run, fsynced every batch or flush interval."""
+
+	def __init__(self, path: str, batch_size: int = 256, interval: float = 1.0) -> None:
+		super().__init__(path, batch_size)
+		self.interval = interval
+		self.flushed = time.monotonic()
+		self.buffer_lock = threading.RLock()
+
+	def write(self, item: Union[Performer, Item, PageDone, ItemDone]) -> None:
+
+		with self.buffer_lock:
+			super().write(item)
+
+			if time.monotonic() - self.flushed >= self.interval:
+				self.flush()
+
+	def flush(self) -> None:
+
+		with self.buffer_lock:
+			self.flushed = time.monotonic()
+
+			if not self.buffer:
+				return
+
+			with open(self.path, 'ab') as journal_file:
+				journal_file.write(self.buffer)
+				journal_file.flush()
+				os.fsync(journal_file.fileno())
+
+			self.buffer.clear()
+			self.pending = 0
+
+@dataclass(kw_only=True)
+class JournalState:
+	performer: Optional[Performer] = None
+	items: List[Item] = field(default_factory=list)
+	pages: dict[str, int] = field(default_factory=dict)
+	finished: set[str] = field(default_factory=set)
+	done: set[tuple[str, str]] = field(default_factory=set)
+
+	def pending_items(self) -> Iterator[Item]:
+
+		for item in self.items:
+
+			if (ITEM_MEDIA[type(item)], item.id) not in self.done:
+				yield item
+
+def get_journal_path(performer: str) -> str:
+	return os.path.join(get_config().save_path, performer, '.huttpy-journal.ndjson')
+
+def load_journal(path: str) -> JournalState:
+	state = JournalState()
+	valid_bytes = 0
+
+	with open(path, 'rb') as journal_file:
+
+		for line in journal_file:
+
+			try:
+
+				# A record is complete only once its newline is written; anything else is a torn tail, even if it decodes.
+				if not line.endswith(b'\n'):
+					raise msgspec.DecodeError('Missing newline')
+
+				record = JOURNAL_DECODER.decode(line)
+
+			except msgspec.DecodeError:
+				logging.warning(f'Ignoring torn journal record at byte {valid_bytes} of: {path}')
+
+				break
+
+			valid_bytes += len(line)
+
+			if isinstance(record, Performer):
+				state.performer = record
+
+			elif isinstance(record, PageDone):
+				state.pages[record.media] = record.page + 1
+
+				if record.last:
+					state.finished.add(record.media)
+
+			elif isinstance(record, ItemDone):
+
+				if record.ok:
+					state.done.add((record.media, record.id))
+
+			else:
+				state.items.append(record)
+
+	os.truncate(path, valid_bytes)
+
+	return state
+
+def stream_ndjson(items: Iterable[Item], writer: NdjsonWriter) -> Iterator[Item]:
+
+	try:
+
+		for item in items:
+			writer.write(item)
+
+			yield item
+
+	finally:
+		writer.flush()
+
+def parse_query() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(prog='huttpy query', description='Looks up performers and items in the local metadata store.')
+	parser.add_argument('performers', nargs='*', help='Performer names or ids (Defaults to all).')
+	parser.add_argument('--media', '-m', choices=['performers', 'posts', 'photos', 'videos', 'media'], default='performers', help='What to list, media means photos and videos.')
+	parser.add_argument('--post', '-P', default=None, help='Only items belonging to this post hash.')
+	parser.add_argument('--pending', '-q', action='store_true', default=False, help='Only photos and videos not downloaded yet.')
+	parser.add_argument('--failed', '-f', action='store_true', default=False, help='Only photos and videos whose last download failed.')
+	parser.add_argument('--format', '-F', choices=['table', 'ndjson', 'urls'], default='table', help='ndjson writes a download queue loadable with --load-dict.')
+	parser.add_argument('--output', '-o', default='-', help='Output path, use - for stdout.')
+	parser.add_argument('--db', default=None, help='Metadata store path (Defaults to the user data folder).')
+
+	return parser
 
 def get_config_path(path: Union[str, os.PathLike[str], None] = None) -> pathlib.Path:
 	if path is None:
@@ -124,11 +506,13 @@ def load_config(path: Union[str, os.PathLike[str], None] = None) -> DefaultConfi
 	with open(path, 'r', encoding=DEFAULT_ENCODING) as fp:
 		data = fp.read()
 
-	config_dict = tomlkit.loads(data)
+	import tomlkit
+	config_dict = tomlkit.loads(data).unwrap()
 
 	return msgspec.convert(config_dict, type=DefaultConfig)
 
 def save_config(configuration: DefaultConfig, path: Union[str, os.PathLike[str], None] = None) -> None:
+	import tomlkit
 	path = get_config_path(path)
 
 	data = tomlkit.dumps(msgspec.to_builtins(configuration))
@@ -155,404 +539,2109 @@ def load_or_create_config(path: Union[str, os.PathLike[str], None] = None) -> De
 	save_config(configuration, path)
 	return configuration
 
-CONFIG = load_or_create_config()
-BASE_URL = CONFIG.base_url
-CHAR_TABLE = CONFIG.char_table
-TABLE = str.maketrans(CHAR_TABLE)
+@functools.cache
+def get_config() -> DefaultConfig:
+	return load_or_create_config()
+
+class FilenameTable(dict[int, str]):
+	"""Translation table that applies the char table and blanks everything but letters and digits, filled in lazily per code point."""
+
+	def __init__(self, char_table: dict[str, str]) -> None:
+		super().__init__()
+		self.char_table = str.maketrans(char_table)
+
+	def __missing__(self, code: int) -> str:
+		replacement = self.char_table.get(code, chr(code))
+		cleaned = ''.join(c if unicodedata.category(c)[0] in 'LN' else ' ' for c in replacement)
+		self[code] = cleaned
+
+		return cleaned
+
+@functools.cache
+def get_table() -> FilenameTable:
+	return FilenameTable(get_config().char_table)
+
+@functools.cache
+def get_user_agent() -> str:
+	from getuseragent import UserAgent #type: ignore
+
+	return str(UserAgent('chrome', limit=1).list[0])
+
+def load_cookies() -> MozillaCookieJar:
+	from http.cookiejar import LoadError, MozillaCookieJar
 
-def load_session() -> requests.sessions.Session:
 	cookie_jar = MozillaCookieJar(COOKIES_PATH)
-	cookie_jar.load(ignore_discard=True, ignore_expires=True)
+
+	try:
+		cookie_jar.load(ignore_discard=True, ignore_expires=True)
+
+	except FileNotFoundError:
+		logging.error(f'Cookies missing from: {str(COOKIES_PATH)}')
+		raise
+
+	except LoadError:
+		logging.error(f'Invalid Netscape cookies file: {str(COOKIES_PATH)}')
+		raise
+
+	logging.info(f'Previous cookies found in: {str(COOKIES_PATH)}')
+
+	return cookie_jar
+
+def load_session() -> requests.sessions.Session:
+	import requests
+
+	config = get_config()
 	session = requests.Session()
-	session.cookies = cast(requests.cookies.RequestsCookieJar, cookie_jar)
+	session.cookies = cast(requests.cookies.RequestsCookieJar, load_cookies())
+	adapter = requests.adapters.HTTPAdapter(pool_connections=max(1, config.pool_connections), pool_maxsize=max(1, config.pool_maxsize))
+	session.mount('https://', adapter)
+	session.mount('http://', adapter)
 
 	return session
 
-try:
-	SESSION = load_session()
+@functools.cache
+def get_session() -> requests.sessions.Session:
+	return load_session()
 
-except FileNotFoundError:
-	logging.error(f'Cookies missing from: {str(COOKIES_PATH)}')
-	sys.exit(1)
+class Response(Protocol):
+	"""The subset of requests.Response used by huttpy, implemented by every transport."""
 
-except LoadError:
-	logging.error(f'Invalid Netscape cookies file: {str(COOKIES_PATH)}')
-	sys.exit(1)
+	status_code: int
+	headers: Any
+	content: bytes
 
-finally:
-	logging.info(f'Previous cookies found in: {str(COOKIES_PATH)}')
+	def raise_for_status(self) -> None: ...
+
+	def iter_content(self, chunk_size: int) -> Iterator[bytes]: ...
+
+	def close(self) -> None: ...
+
+	def __enter__(self) -> Response: ...
+
+	def __exit__(self, *args: object) -> None: ...
+
+class Transport(Protocol):
+
+	def get(self, url: str, headers: dict[str, str], stream: bool = False) -> Response: ...
+
+	def close(self) -> None: ...
+
+class RequestsTransport:
+	"""Blocking transport backed by the shared requests session."""
+
+	def __init__(self, session: requests.sessions.Session) -> None:
+		self.session = session
+		self.timeout = get_config().request_timeout or None
+
+	def get(self, url: str, headers: dict[str, str], stream: bool = False) -> Response:
+		return cast(Response, self.session.get(url, headers=headers, stream=stream, timeout=self.timeout))
+
+	def close(self) -> None:
+		self.session.close()
+
+@functools.cache
+def get_transport() -> Transport:
+	return RequestsTransport(get_session())
+
+LAZY_GLOBALS = types.MappingProxyType({
+	'CONFIG': get_config,
+	'BASE_URL': lambda: get_config().base_url,
+	'CHAR_TABLE': lambda: get_config().char_table,
+	'TABLE': get_table,
+	'SESSION': get_session,
+	'TRANSPORT': get_transport,
+	'USER_AGENT': get_user_agent,
+})
+
+def __getattr__(name: str) -> object:
+
+	if name in LAZY_GLOBALS:
+		return LAZY_GLOBALS[name]()
+
+	raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def configure_logging() -> None:
+	from rich.logging import RichHandler
+
+	logging.basicConfig(level=logging.INFO, format="%(message)s", datefmt="[%X]", handlers=[RichHandler()])
+
+TRANSFER_TIMERS = {'photos': 'transfer.photos', 'videos': 'video.yt_dlp'}
+
+class Metrics:
+	"""Thread-safe timers and counters for the scrape and download stages."""
+
+	def __init__(self) -> None:
+		self.lock = threading.Lock()
+		self.started = time.monotonic()
+		self.timers: dict[str, List[float]] = {}
+		self.counters: dict[str, float] = {}
+
+	def observe(self, name: str, seconds: float) -> None:
+
+		with self.lock:
+			self.timers.setdefault(name, []).append(seconds)
+
+	def count(self, name: str, value: float = 1) -> None:
+
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + value
 
-def make_request(url: str, referer: Optional[dict[str, str]]) -> requests.Response:
-	headers = {'User-Agent': USER_AGENT}
+	@contextlib.contextmanager
+	def time(self, name: str) -> Iterator[None]:
+		start = time.perf_counter()
+
+		try:
+			yield
+
+		finally:
+			self.observe(name, time.perf_counter() - start)
+
+	def summary(self) -> dict[str, Any]:
+
+		with self.lock:
+			timers = {name: sorted(samples) for name, samples in self.timers.items()}
+			counters = dict(self.counters)
+
+		summary: dict[str, Any] = {'elapsed_seconds': round(time.monotonic() - self.started, 3), 'timers': {}, 'counters': counters, 'throughput': {}}
+
+		for name, samples in sorted(timers.items()):
+			summary['timers'][name] = {
+				'count': len(samples),
+				'total_seconds': round(sum(samples), 4),
+				'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+				**{f'p{q}_ms': round(samples[min(len(samples) - 1, len(samples) * q // 100)] * 1000, 3) for q in (50, 90, 99)},
+				'max_ms': round(samples[-1] * 1000, 3)
+			}
+
+		for media, timer in TRANSFER_TIMERS.items():
+			busy = sum(timers.get(timer, []))
+
+			if busy:
+				summary['throughput'][f'{media}_bytes_per_second'] = round(counters.get(f'bytes.{media}', 0) / busy, 1)
+
+		return summary
+
+	def prometheus(self) -> str:
+		summary = self.summary()
+		lines = ['# TYPE huttpy_elapsed_seconds gauge', f'huttpy_elapsed_seconds {summary["elapsed_seconds"]}']
+
+		for name, timer in summary['timers'].items():
+			metric = f'huttpy_{re.sub(r"[^a-zA-Z0-9_]", "_", name)}_seconds'
+			lines.append(f'# TYPE {metric} summary')
+			lines.extend(f'{metric}{{quantile="0.{q}"}} {round(timer[f"p{q}_ms"] / 1000, 6)}' for q in (50, 90, 99))
+			lines.extend([f'{metric}_sum {timer["total_seconds"]}', f'{metric}_count {timer["count"]}'])
+
+		for name, value in sorted(summary['counters'].items()):
+			metric = f'huttpy_{re.sub(r"[^a-zA-Z0-9_]", "_", name)}_total'
+			lines.extend([f'# TYPE {metric} counter', f'{metric} {value}'])
+
+		return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+def make_request(url: str, referer: Optional[dict[str, str]], stream: bool = False, range_start: int = 0) -> Response:
+	headers = {'User-Agent': get_user_agent()}
 
 	if referer:
 		headers.update(referer)
 
-	return SESSION.get(url, headers=headers)
+	if range_start:
+		headers['Range'] = f'bytes={range_start}-'
 
-def countdown(seconds: int, idx: int, total: int) -> None:
+	with METRICS.time('http.request'):
+		return get_transport().get(url, headers=headers, stream=stream)
 
-	if idx != total:
+class TokenBucket:
+	"""Thread-safe token bucket, a rate of 0 or less disables limiting."""
 
-		while seconds > 0:
-			time.sleep(1)
-			seconds -= 1
+	def __init__(self, rate: float, burst: int, name: str = 'limiter') -> None:
+		self.name = name
+		self.rate = rate
+		self.capacity = float(max(1, burst))
+		self.tokens = self.capacity
+		self.updated = time.monotonic()
+		self.lock = threading.Lock()
 
-def make_dirs(performer: str, photos_count: int, videos_count: int) -> None:
+	def acquire(self) -> None:
 
-	if photos_count:
-		directory1 = os.path.join(CONFIG.save_path, performer, 'Images')
-		os.makedirs(directory1, exist_ok=True)
+		if self.rate <= 0:
+			return
 
-	if videos_count:
-		directory2 = os.path.join(CONFIG.save_path, performer, 'Videos')
-		os.makedirs(directory2, exist_ok=True)
+		while True:
 
-def format_filenames(performer: str, post_id: str, text: str) -> str:
-	filename_format = CONFIG.filename_format
-	char_limit = int(CONFIG.char_limit)
-	clean_text = clean_string(text)[0:char_limit].strip()
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+				self.updated = now
 
-	if CONFIG.lowercase == False:
-		clean_text = clean_text.lower()
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
 
-	format_dict: dict[str, object] = {
-		'username': performer,
-		'post_id': post_id,
-		'text': text,
-		'text_cleaned': clean_text if clean_text else 'NA',
-	}
+				wait = (1 - self.tokens) / self.rate
 
-	return str(filename_format.format(**format_dict))
+			METRICS.count(f'sleep_seconds.{self.name}', wait)
+			time.sleep(wait)
 
-def clean_string(string: str) -> str:
-	intermediate_string1 = string.translate(TABLE)
-	intermediate_string2 = intermediate_string1.translate({ord(c): ' ' for c in intermediate_string1 if not c.isalnum()})
+class AdaptiveLimiter(TokenBucket):
+	"""Token bucket whose rate grows additively on healthy responses and shrinks multiplicatively on throttling or slow responses."""
 
-	return ' '.join(intermediate_string2.split())
+	def __init__(self, name: str, rate: float, burst: int) -> None:
+		config = get_config()
+		super().__init__(rate, burst, name)
+		self.min_rate = config.min_requests_per_second
+		self.max_rate = max(rate, config.max_requests_per_second)
+		self.blocked_until = 0.0
 
-def detect_text(element: Tag) -> str:
+	def acquire(self) -> None:
 
-	post_text = element.text if hasattr(element, 'text') else ''
-		
-	return post_text
+		while True:
 
-def get_local_hutt(content_path: str) -> MetaObject:
+			with self.lock:
+				wait = self.blocked_until - time.monotonic()
 
-	with open(content_path, 'r', encoding='utf8') as json_file:
-		content = json.load(json_file)
+			if wait <= 0:
+				break
 
-	meta_object = MetaObject(performer=content['performer'], performer_id=int(content['performer_id']))
+			METRICS.count(f'sleep_seconds.{self.name}', wait)
+			time.sleep(wait)
 
-	if 'photos' in content:
+		super().acquire()
 
-		for k in content['photos'].keys():
-			meta_object.photos.append(Photo(id=k, data=Info(url=content['photos'][k]['url'], description=content['photos'][k]['description'])))
+	def observe(self, status_code: Optional[int], retry_after: Optional[str] = None, latency: Optional[float] = None) -> bool:
+		config = get_config()
+		throttled = status_code is None or status_code in THROTTLE_STATUSES
+		METRICS.count(f'responses.{self.name}.{status_code or "error"}')
+		slow = latency is not None and latency > config.slow_response
 
-	if 'posts' in content:
+		with self.lock:
 
-		for k in content['posts'].keys():
-			meta_object.posts.append(Post(id=k, description=content['posts'][k]))
+			if self.rate <= 0 and not throttled:
+				return False
 
-	if 'videos' in content:
+			if throttled or slow:
+				delay = parse_retry_after(retry_after)
 
-		for k in content['videos'].keys():
-			meta_object.videos.append(Video(id=k, data=Info(url=content['videos'][k]['url'], description=content['videos'][k]['description'])))
+				if delay:
+					self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
 
-	return meta_object
+				if self.rate > 0:
+					self.rate = max(self.min_rate, self.rate * config.rate_decrease)
+					self.tokens = min(self.tokens, 0.0)
 
-def get_hutt(meta_object: MetaObject, perf_id: int,  performer: str, base_url: str, skip_posts: bool = False, skip_photos: bool = False, skip_videos: bool = False) -> None:	
-	media_types = ['photos', 'videos', 'view']
-	headers = {'Referer': urljoin(base_url, performer), 'User-Agent': USER_AGENT}
+				reason = f'{latency:.1f} second response' if not throttled else f'HTTP {status_code}' if status_code else 'request failed'
+				logging.warning(f'{self.name}: {reason}, slowing down to {self.rate:.2f} requests per second' + (f' after waiting {delay:.0f} seconds' if delay else ''))
 
-	for m in media_types:
-		page = 0
+			else:
+				self.rate = min(self.max_rate, self.rate + config.rate_increase)
 
-		if (m == 'view' and not skip_posts) or (m == 'photos' and not skip_photos) or (m == 'videos' and not skip_videos):
+		return throttled
 
-			if m in ['photos', 'videos']:
-				headers['Referer'] = f'{headers["Referer"]}{m}'
+def parse_retry_after(value: Optional[str]) -> float:
 
-			while True:
-				ajax_url = f'{BASE_URL}/hutts/ajax-posts?page={page}&view={m}&id={perf_id}'
-				r = SESSION.get(ajax_url, headers=headers)
-				r.raise_for_status()
-				soup = BeautifulSoup(r.content, 'html.parser')
-				page += 1
-				seconds = 2
+	if not value:
+		return 0.0
 
-				if r.content == b'':
-				
-					break
+	try:
+		return max(0.0, float(value))
 
-				logging.info(f'{ajax_url} - Status code: {r.status_code} - Sleeping: {seconds} seconds')
-				countdown(seconds, 0, 2)
+	except ValueError:
+		pass
 
-				if m == 'photos' and not skip_photos:
-					get_imgs_data(soup, meta_object)
+	from email.utils import parsedate_to_datetime
 
-				if m == 'videos' and not skip_videos:
-					get_vids_data(soup, meta_object)
+	try:
+		return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
 
-				if m == 'view' and not skip_posts:
-					get_posts_data(soup, meta_object)
+	except (TypeError, ValueError):
+		return 0.0
 
-def get_posts_data(soup: BeautifulSoup, meta_object: MetaObject) -> None:
-	posts_elements = soup.find_all(class_='post-text')
+@dataclass(kw_only=True)
+class ManifestEntry:
+	media: str
+	item_id: str
+	url: str
+	path: str
+	size: int
+	etag: Optional[str] = None
+	last_modified: Optional[str] = None
+	sha256: Optional[str] = None
+	mtime_ns: Optional[int] = None
 
-	if posts_elements:
+	def is_intact(self) -> bool:
 
-		for ele in posts_elements:
-			post_text = detect_text(ele)
-			dynamic_id_parent = ele.find_parent('div', class_='huttPost')
+		try:
+			stat = os.stat(self.path)
 
-			if dynamic_id_parent:
-				dynamic_id = dynamic_id_parent.get('id').replace('post-', '')
+		except OSError:
+			return False
 
-				meta_object.posts.append(Post(id=dynamic_id, description=post_text))
+		if stat.st_size != self.size:
+			return False
 
-def get_imgs_data(soup: BeautifulSoup, meta_object: MetaObject) -> None:
-	carousels = soup.find_all('div', class_='carousel-inner')
+		if self.mtime_ns is not None and stat.st_mtime_ns == self.mtime_ns:
+			return True
 
-	for carousel in carousels:
-		parent_div = carousel.find_parent('div', id=lambda x: x and x.startswith('grid-carousel-'))
+		if self.sha256 is not None:
+			return file_digest(self.path).hexdigest() == self.sha256
 
-		if parent_div:
-			dynamic_id = parent_div.get('id').replace('grid-carousel-', '')
-			post_modal_div = parent_div.find_next_sibling(lambda x: x.name == 'div' and x.get('id', '').startswith('post-modal'))
+		return self.mtime_ns is None
 
-			if post_modal_div:
-				post_modal_body = post_modal_div.find('div', class_='modal-body')
+class DownloadManifest:
+	"""Per-performer SQLite record of completed downloads."""
 
-				if post_modal_body:
-					post_text_element = post_modal_body.find('div', class_='post-text')
+	def __init__(self, path: str) -> None:
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+		self.connection.execute(
+			'CREATE TABLE IF NOT EXISTS downloads ('
+			'media TEXT NOT NULL, item_id TEXT NOT NULL, url TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, '
+			'etag TEXT, last_modified TEXT, sha256 TEXT, completed_at TEXT NOT NULL, mtime_ns INTEGER, PRIMARY KEY (media, item_id))'
+		)
 
-					if post_text_element:
-						post_text = detect_text(post_text_element)
+		if 'mtime_ns' not in {row[1] for row in self.connection.execute('PRAGMA table_info(downloads)')}:
+			self.connection.execute('ALTER TABLE downloads ADD COLUMN mtime_ns INTEGER')
 
-		carousel_imgs = carousel.find_all('img')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS downloads_path ON downloads (path)')
+		self.connection.commit()
 
-		for idx, ele in enumerate(carousel_imgs):
-			src = ele.get('src') or ele.get('data-src')
+	def get(self, media: str, item_id: str) -> Optional[ManifestEntry]:
 
-			if src:
-				meta_object.photos.append(Photo(id=f'{dynamic_id}-{idx+1}', data=Info(url=f'{BASE_URL}{src.replace("/middle", "")}', description=post_text)))
+		with self.lock:
+			row = self.connection.execute(
+				'SELECT url, path, size, etag, last_modified, sha256, mtime_ns FROM downloads WHERE media = ? AND item_id = ?', (media, item_id)
+			).fetchone()
 
-	img_elements = soup.find_all('img')
+		if row is None:
+			return None
 
-	for ele in img_elements:
-		event_wrap_ele = ele.parent.find(class_='eventwrap')
-	
-		if event_wrap_ele:
-			dynamic_id = event_wrap_ele.get('data-post-hash')
+		url, path, size, etag, last_modified, sha256, mtime_ns = row
 
-		src = ele.get('src') or ele.get('data-src')
+		return ManifestEntry(media=media, item_id=item_id, url=url, path=path, size=size, etag=etag, last_modified=last_modified, sha256=sha256, mtime_ns=mtime_ns)
 
-		if src:
-			modal_id = f'post-modal-{dynamic_id}'
-			modal = soup.find('div', id=modal_id)
+	def owner(self, path: str) -> Optional[tuple[str, str]]:
+		"""Returns the (media, item_id) that last recorded a download at path."""
 
-			if isinstance(modal, Tag):
-				post_text_element = modal.find('div', class_='post-text') 
+		with self.lock:
+			row = self.connection.execute(
+				'SELECT media, item_id FROM downloads WHERE path = ? ORDER BY completed_at DESC LIMIT 1', (path,)
+			).fetchone()
 
-				if post_text_element:
-					post_text = detect_text(post_text_element)
-	
-			if dynamic_id not in [p.id.split('-')[0] for p in meta_object.photos] and '/middle' in src:
-				meta_object.photos.append(Photo(id=dynamic_id, data=Info(url=f'{BASE_URL}{src.replace("/middle", "")}', description=post_text)))
+		return (row[0], row[1]) if row else None
 
-def get_vids_data(soup: BeautifulSoup, meta_object: MetaObject) -> None:
-	videos_elements = soup.find_all('video')
+	def paths(self, media: str) -> List[tuple[str, str]]:
 
-	if videos_elements:
+		with self.lock:
+			return self.connection.execute('SELECT item_id, path FROM downloads WHERE media = ?', (media,)).fetchall()
 
-		for ele in videos_elements:
-			parent_ele = ele.find_parent('div', id=lambda x: x and x.startswith('post-modal'))
+	def record(self, entry: ManifestEntry) -> None:
 
-			if parent_ele:
-				dynamic_id = parent_ele.get('id').replace('post-modal-', '')
-				post_text_element = parent_ele.find(class_='post-text')
+		if entry.mtime_ns is None and os.path.isfile(entry.path):
+			entry = replace(entry, mtime_ns=os.stat(entry.path).st_mtime_ns)
 
-				if post_text_element:
-					post_text = detect_text(post_text_element)
+		with self.lock:
+			self.connection.execute(
+				'INSERT OR REPLACE INTO downloads (media, item_id, url, path, size, etag, last_modified, sha256, completed_at, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				(entry.media, entry.item_id, entry.url, entry.path, entry.size, entry.etag, entry.last_modified, entry.sha256, datetime.now().isoformat(), entry.mtime_ns)
+			)
+			self.connection.commit()
 
-			src = f'{BASE_URL}{ele.find("source").get("src")}'
-			meta_object.videos.append(Video(id=dynamic_id, data=Info(url=src.replace('/middle', ''), description=post_text)))
+	def close(self) -> None:
 
-def save_posts(meta_object: MetaObject, performer: str) -> None:
-	posts_dict = {}
-	output_path = os.path.join(CONFIG.save_path, performer, f'{performer}.json')
-	total = len(meta_object.posts)
+		with self.lock:
+			self.connection.close()
 
-	for idx, p in enumerate(meta_object.posts):
-		logging.info(f'Saving post {idx+1} out of {total} with hash number: {p.id}')
-		posts_dict[p.id] = p.description
+@dataclass(kw_only=True)
+class CachedPage:
+	url: str
+	etag: Optional[str]
+	last_modified: Optional[str]
+	body_hash: str
+	items: bytes
 
-	save_json(posts_dict, output_path)
+	def decode_items(self) -> List[Item]:
+		return PAGE_ITEMS_DECODER.decode(self.items)
 
-def get_dl_img(meta_object: MetaObject, performer: str, skip_videos: bool) -> None:
-	total = len(meta_object.photos)
-	max_retries = 4
+class PageCache:
+	"""SQLite cache of extracted ajax pages, validated by ETag/Last-Modified or by a hash of the body."""
 
-	for idx, p in enumerate(meta_object.photos):
-		item_no = idx + 1
-		seconds: int = 2
-		logging.info(f'Downloading photo {item_no} out of {total} with hash: {p.id}')
-		fname = format_filenames(performer, p.id, p.data.description)
-		output_path = os.path.join(CONFIG.save_path, performer, 'Images', f'{fname}.jpg')
-		
-		for attempt in range(max_retries):
+	def __init__(self, path: Union[str, os.PathLike[str]], max_age: float, max_bytes: int) -> None:
+		self.lock = threading.Lock()
+		self.max_age = max_age
+		self.max_bytes = max_bytes
+		self.writes = 0
+		self.encoder = msgspec.msgpack.Encoder()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+		self.connection.execute(
+			'CREATE TABLE IF NOT EXISTS pages ('
+			'url TEXT PRIMARY KEY, version INTEGER NOT NULL, etag TEXT, last_modified TEXT, body_hash TEXT NOT NULL, '
+			'items BLOB NOT NULL, size INTEGER NOT NULL, fetched_at REAL NOT NULL, used_at REAL NOT NULL)'
+		)
+		self.connection.commit()
+		self.evict()
+
+	def get(self, url: str) -> Optional[CachedPage]:
+
+		with self.lock:
+			row = self.connection.execute(
+				'SELECT etag, last_modified, body_hash, items FROM pages WHERE url = ? AND version = ?', (url, PAGE_CACHE_VERSION)
+			).fetchone()
+
+		if row is None:
+			return None
+
+		etag, last_modified, body_hash, items = row
+
+		return CachedPage(url=url, etag=etag, last_modified=last_modified, body_hash=body_hash, items=items)
+
+	def touch(self, url: str) -> None:
+
+		with self.lock:
+			self.connection.execute('UPDATE pages SET used_at = ? WHERE url = ?', (time.time(), url))
+			self.connection.commit()
+
+	def put(self, url: str, etag: Optional[str], last_modified: Optional[str], body_hash: str, items: List[Item]) -> None:
+		blob = self.encoder.encode(items)
+		now = time.time()
+
+		with self.lock:
+			self.connection.execute(
+				'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				(url, PAGE_CACHE_VERSION, etag, last_modified, body_hash, blob, len(blob) + len(url), now, now)
+			)
+			self.connection.commit()
+			self.writes += 1
+
+		if self.writes % 256 == 0:
+			self.evict()
 
-			try:
-				s = make_request(p.data.url, referer={'Referer': f'{BASE_URL}/{performer}/photos'})
+	def evict(self) -> None:
 
-				with open(output_path, 'wb') as f:
-					f.write(s.content)
+		with self.lock:
+			self.connection.execute('DELETE FROM pages WHERE fetched_at < ? OR version != ?', (time.time() - self.max_age * 86400, PAGE_CACHE_VERSION))
+			total = 0
+			expired = []
 
-				break
+			for url, size in self.connection.execute('SELECT url, size FROM pages ORDER BY used_at DESC'):
+				total += size
 
-			except requests.exceptions.RequestException as e:
-				logging.warning(f'Attempt {attempt + 1} failed for photo {p.id}: {e}')
-				retry_seconds = 4
-				logging.info(f'Seeping: {seconds} seconds')
+				if total > self.max_bytes:
+					expired.append((url,))
 
-				if attempt < max_retries - 1:
-					countdown(retry_seconds, 0, 4)
+			self.connection.executemany('DELETE FROM pages WHERE url = ?', expired)
+			self.connection.commit()
 
-				else:
-					logging.error(f'Failed to download photo {p.id} after {max_retries} attempts')
+	def close(self) -> None:
 
-		if item_no == total and skip_videos:
+		with self.lock:
+			self.connection.close()
 
-			return
+@functools.cache
+def get_page_cache() -> Optional[PageCache]:
+	config = get_config()
 
-		logging.info(f'Sleeping: {seconds} seconds')
-		countdown(seconds, item_no, total)
+	if not config.page_cache:
+		return None
 
-def get_dl_vids(meta_object: MetaObject, performer: str) -> None:
-	total = len(meta_object.videos)
- 
-	for idx, v in enumerate(meta_object.videos):
-		fname = format_filenames(performer, v.id, v.data.description)
-		item_no = idx+1
-		seconds = 4 
-		logging.info(f'Downloading video {item_no} out of {total}')
+	PAGE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-		yt_dlp_command = [
-			'yt-dlp', v.data.url,
-			'--abort-on-unavailable-fragments',
-			'--hls-prefer-native',
-			'--retries', '100',
-			'--retry-sleep', '4',
-			'--user-agent', USER_AGENT,
-			'--referer', f'{BASE_URL}/{performer}/videos',
-			'--cookies', str(COOKIES_PATH),
-			'-o', os.path.normpath(os.path.join(CONFIG.save_path, performer, 'Videos', f'{fname}.%(ext)s'))
-		]
+	return PageCache(PAGE_CACHE_PATH, config.page_cache_max_age, int(config.page_cache_max_mb * 1024 * 1024))
 
-		subprocess.run(yt_dlp_command, check=False)
+def page_hash(content: bytes) -> str:
+	return hashlib.blake2b(content, digest_size=16).hexdigest()
 
-		if item_no != total:
-			logging.info(f'Sleeping: {seconds} seconds')
-			countdown(seconds, item_no, total)
+class MetadataStore:
+	"""SQLite store of scraped performers, posts, photos, videos and their download status, written with bulk upserts."""
 
-def get_id(soup: BeautifulSoup) -> int:
-	id_element = soup.find('input', {'type': 'hidden', 'name': 'id'})
+	UPSERTS = types.MappingProxyType({
+		'posts': 'INSERT INTO posts VALUES (?, ?, ?) ON CONFLICT (performer_id, id) DO UPDATE SET description = excluded.description',
+		'photos': 'INSERT INTO photos VALUES (?, ?, ?, ?, ?) ON CONFLICT (performer_id, id) DO UPDATE SET url = excluded.url, description = excluded.description',
+		'videos': 'INSERT INTO videos VALUES (?, ?, ?, ?) ON CONFLICT (performer_id, id) DO UPDATE SET url = excluded.url, description = excluded.description',
+		'downloads': 'INSERT INTO downloads VALUES (?, ?, ?, ?, ?) ON CONFLICT (performer_id, media, item_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at'
+	})
 
-	if isinstance(id_element, Tag):
-		id_value = id_element.get('value')
+	def __init__(self, path: Union[str, os.PathLike[str]], batch_size: int = 1000) -> None:
+		self.lock = threading.Lock()
+		self.batch_size = batch_size
+		self.pending: dict[str, List[tuple[Any, ...]]] = {table: [] for table in self.UPSERTS}
+		self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+		self.connection.executescript(
+			'CREATE TABLE IF NOT EXISTS performers (performer_id INTEGER PRIMARY KEY, performer TEXT NOT NULL, updated_at TEXT NOT NULL);'
+			'CREATE TABLE IF NOT EXISTS posts (performer_id INTEGER NOT NULL, id TEXT NOT NULL, description TEXT NOT NULL, PRIMARY KEY (performer_id, id));'
+			'CREATE TABLE IF NOT EXISTS photos (performer_id INTEGER NOT NULL, id TEXT NOT NULL, post_id TEXT NOT NULL, url TEXT NOT NULL, description TEXT NOT NULL, PRIMARY KEY (performer_id, id));'
+			'CREATE TABLE IF NOT EXISTS videos (performer_id INTEGER NOT NULL, id TEXT NOT NULL, url TEXT NOT NULL, description TEXT NOT NULL, PRIMARY KEY (performer_id, id));'
+			'CREATE TABLE IF NOT EXISTS downloads (performer_id INTEGER NOT NULL, media TEXT NOT NULL, item_id TEXT NOT NULL, status TEXT NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (performer_id, media, item_id));'
+			'CREATE INDEX IF NOT EXISTS performers_name ON performers (performer);'
+			'CREATE INDEX IF NOT EXISTS posts_id ON posts (id);'
+			'CREATE INDEX IF NOT EXISTS photos_post_id ON photos (post_id);'
+			'CREATE INDEX IF NOT EXISTS videos_id ON videos (id);'
+		)
+		self.connection.commit()
 
-		if isinstance(id_value, str):
+	def add_performer(self, performer: str, performer_id: int) -> None:
 
-			return int(id_value)
+		with self.lock:
+			self.connection.execute(
+				'INSERT INTO performers VALUES (?, ?, ?) ON CONFLICT (performer_id) DO UPDATE SET performer = excluded.performer, updated_at = excluded.updated_at',
+				(performer_id, performer, datetime.now().isoformat())
+			)
+			self.connection.commit()
 
-	raise ValueError("id not found or is not a valid integer")
+	def add(self, performer_id: int, item: Item) -> None:
 
-def get_last_segment(url: str) -> str:
-	parsed_url = urlparse(url)
+		if isinstance(item, Post):
+			self.queue('posts', (performer_id, item.id, item.description))
 
-	return parsed_url.path.replace('/', '')
+		elif isinstance(item, Photo):
+			self.queue('photos', (performer_id, item.id, item.id.split('-')[0], item.data.url, item.data.description))
 
-def test_cookies(soup: BeautifulSoup) -> bool:
-	sign_up = soup.find(class_='sign-up')
-	have_account = soup.find(class_='have-account') 
+		else:
+			self.queue('videos', (performer_id, item.id, item.data.url, item.data.description))
 
-	if sign_up or have_account:
-		return True
+	def mark_downloads(self, performer_id: int, media: str, item_ids: Iterable[str], status: str) -> None:
+		now = datetime.now().isoformat()
 
-	return False
+		for item_id in item_ids:
+			self.queue('downloads', (performer_id, media, item_id, status, now))
 
-def main() -> None:
-	parser = parse_huttpy()
-	args = parser.parse_args(sys.argv[1:])
- 
-	for arg in args.url:
-		logging.info(f'Processing: {arg}')
+	def queue(self, table: str, row: tuple[Any, ...]) -> None:
 
-		try:
+		with self.lock:
+			self.pending[table].append(row)
+			full = len(self.pending[table]) >= self.batch_size
 
-			if args.load_dict:
-				meta_object = get_local_hutt(arg)
-				performer, perf_id = meta_object.performer, meta_object.performer_id
+		if full:
+			self.flush()
 
-			if not args.load_dict:
-				r = make_request(arg, referer=None)
-				r.raise_for_status
-				soup = BeautifulSoup(r.content, 'html.parser')
-				bad_cookies = test_cookies(soup)
-					
-				if bad_cookies:
-					logging.error('Cannot log in: Cookies expired or invalid.')
-					logging.info(f'Location of cookies file: {COOKIES_PATH}')
-					sys.exit(1)
+	def flush(self) -> None:
 
-				perf_id = get_id(soup)
-				performer = get_last_segment(arg)
-				meta_object = MetaObject(performer=performer, performer_id=perf_id)
-				get_hutt(meta_object, perf_id, performer, args.skip_posts, args.skip_photos, args.skip_videos)
+		with self.lock:
 
-			print_json(data={'performer': performer, 'performer_id': perf_id, 'posts_count': len(meta_object.posts), 'photos_count': len(meta_object.photos), 'videos_count': len(meta_object.videos)}, indent=4)
+			for table, rows in self.pending.items():
 
-			if args.json:
-				filename = f'huttpy-Dict-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.json'
+				if rows:
+					self.connection.executemany(self.UPSERTS[table], rows)
+					rows.clear()
 
-				if os.path.isfile(args.output):
-					output = args.output
+			self.connection.commit()
 
-				elif os.path.isdir(args.output):
+	def close(self) -> None:
+		self.flush()
 
-					if not os.path.exists(args.output):
-						os.makedirs(args.output)
+		with self.lock:
+			self.connection.close()
 
-					output = os.path.join(args.output, filename)
+def stream_store(items: Iterable[Item], store: MetadataStore, performer_id: int) -> Iterator[Item]:
 
-				else:
-					full_path = os.path.join(os.path.expanduser('~'), filename)
-					logging.warning(f'Path does not exist, defaulting to: {full_path}')
-					output = os.path.join(os.path.expanduser('~'), 'Desktop', filename)
+	try:
 
-				save_json(meta_object.asdict(), output)
+		for item in items:
+			store.add(performer_id, item)
 
-			if not args.no_download:
+			yield item
 
-				if not args.no_prompts:
-					input('Press Enter to start downloading')
+	finally:
+		store.flush()
 
-				if meta_object:
-					make_dirs(performer, len(meta_object.photos), len(meta_object.videos))
+def get_manifest_path(performer: str) -> str:
+	return os.path.join(get_config().save_path, performer, '.huttpy-manifest.sqlite')
 
-				if meta_object.posts and not args.skip_posts:
-					save_posts(meta_object, performer)
+def file_digest(path: str, digest: Optional['hashlib._Hash'] = None) -> 'hashlib._Hash':
+	digest = digest or hashlib.sha256()
 
-				if meta_object.photos and not args.skip_photos:
-					get_dl_img(meta_object, performer, args.skip_videos)
+	with open(path, 'rb') as f:
 
-				if meta_object.videos and not args.skip_videos:
-					get_dl_vids(meta_object, performer)
+		for chunk in iter(lambda: f.read(max(1, get_config().chunk_size)), b''):
+			digest.update(chunk)
 
-		except (KeyError, FileNotFoundError, json.JSONDecodeError, requests.exceptions.ConnectionError, requests.exceptions.HTTPError, ValueError) as e:
-			logging.error(f'{type(e).__name__}: {e}')
-			sys.exit()
+	return digest
+
+def reuse_download(manifest: DownloadManifest, media: str, item: Union[Photo, Video], output_path: str) -> Optional[ManifestEntry]:
+	entry = manifest.get(media, item.id)
+
+	if entry is None or entry.url != item.data.url:
+		return None
+
+	# Another item may have written to the recorded path since, so only a file the manifest still assigns to this item and that is unchanged counts.
+	if manifest.owner(entry.path) not in (None, (media, item.id)) or not entry.is_intact():
+		logging.info(f'Recorded file for {media[:-1]} {item.id} is missing or changed, downloading again: {entry.path}')
+
+		return None
+
+	if entry.mtime_ns != os.stat(entry.path).st_mtime_ns:
+		entry = replace(entry, mtime_ns=None)
+		manifest.record(entry)
+
+	if os.path.normpath(entry.path) != os.path.normpath(output_path) and not os.path.exists(output_path) and manifest.owner(output_path) in (None, (media, item.id)):
+		os.replace(entry.path, output_path)
+		logging.info(f'Renamed {entry.path} to: {output_path}')
+		entry = replace(entry, path=output_path)
+		manifest.record(entry)
+
+	return entry
+
+@functools.cache
+def get_limiter(endpoint: str = 'image') -> AdaptiveLimiter:
+	config = get_config()
+	rates = {'ajax': config.ajax_requests_per_second, 'image': config.requests_per_second, 'video': config.video_requests_per_second}
+
+	return AdaptiveLimiter(endpoint, rates[endpoint], config.burst if endpoint == 'image' else 1)
+
+def make_dirs(performer: str, photos_count: int, videos_count: int) -> None:
+
+	if photos_count:
+		directory1 = os.path.join(get_config().save_path, performer, 'Images')
+		os.makedirs(directory1, exist_ok=True)
+
+	if videos_count:
+		directory2 = os.path.join(get_config().save_path, performer, 'Videos')
+		os.makedirs(directory2, exist_ok=True)
+
+def format_filenames(performer: str, post_id: str, text: str) -> str:
+	config = get_config()
+	clean_text = format_text(text, int(config.char_limit), config.lowercase)
+
+	format_dict: dict[str, object] = {
+		'username': performer,
+		'post_id': post_id,
+		'text': text,
+		'text_cleaned': clean_text if clean_text else 'NA',
+	}
+
+	return str(config.filename_format.format(**format_dict))
+
+@functools.lru_cache(maxsize=4096)
+def format_text(text: str, char_limit: int, lowercase: bool) -> str:
+	text = unicodedata.normalize('NFC', text)
+	window = text[:char_limit * 4]
+	clean_text = clean_string(window)
+
+	if len(window) < len(text) and len(clean_text) <= char_limit:
+		clean_text = clean_string(text)
+
+	clean_text = clean_text[0:char_limit].strip()
+
+	if lowercase == False:
+		clean_text = clean_text.lower()
+
+	return clean_text
+
+def clean_string(string: str) -> str:
+	return ' '.join(string.translate(get_table()).split())
+
+class FilenameRegistry:
+	"""Hands out one file name per item and suffixes the item id when two items of a performer would share a name."""
+
+	def __init__(self, performer: str, manifest: DownloadManifest) -> None:
+		self.performer = performer
+		self.lock = threading.Lock()
+		self.owners: dict[tuple[str, str], Optional[str]] = {}
+		self.names: dict[tuple[str, str], str] = {}
+
+		# Names taken on earlier runs stay with their items, and files the manifest does not know about belong to nobody.
+		for media, folder in (('photos', 'Images'), ('videos', 'Videos')):
+
+			for item_id, path in manifest.paths(media):
+				self.owners.setdefault((media, os.path.splitext(os.path.basename(path))[0].casefold()), item_id)
+
+			directory = os.path.join(get_config().save_path, performer, folder)
+
+			if not os.path.isdir(directory):
+				continue
+
+			for name in os.listdir(directory):
+
+				if not name.endswith(('.part', '.ytdl', '.temp')) and '.part-Frag' not in name:
+					self.owners.setdefault((media, os.path.splitext(name)[0].casefold()), None)
+
+	def claim(self, media: str, fname: str, item_id: str) -> bool:
+		owner = self.owners.setdefault((media, fname.casefold()), item_id)
+
+		# An unrecorded file can only be taken over when its name carries the item id, i.e. it is this item's download from before the manifest.
+		if owner is None and item_id in fname:
+			self.owners[(media, fname.casefold())] = owner = item_id
+
+		return owner == item_id
+
+	def name(self, media: str, item: Union[Photo, Video]) -> str:
+
+		with self.lock:
+
+			if (media, item.id) in self.names:
+				return self.names[(media, item.id)]
+
+			fname = base = format_filenames(self.performer, item.id, item.data.description)
+			suffix = 1
+
+			while not self.claim(media, fname, item.id):
+				fname = f'{base} - {item.id}' if suffix == 1 else f'{base} - {item.id} - {suffix}'
+				suffix += 1
+
+			if fname != base:
+				logging.warning(f'File name already used by another {media[:-1]}, saving {item.id} as: {fname}')
+
+			self.names[(media, item.id)] = fname
+
+			return fname
+
+def detect_text(element: Tag) -> str:
+
+	post_text = element.text if hasattr(element, 'text') else ''
+		
+	return post_text
+
+def read_hutt_dict(content_path: str) -> HuttDict:
+
+	with open(content_path, 'rb') as json_file:
+
+		if os.fstat(json_file.fileno()).st_size == 0:
+			return HUTT_DICT_DECODER.decode(b'')
+
+		with mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+			return HUTT_DICT_DECODER.decode(buffer)
+
+def get_local_hutt(content_path: str) -> MetaObject:
+	content = read_hutt_dict(content_path)
+	meta_object = MetaObject(performer=content.performer, performer_id=content.performer_id)
+
+	for k, info in content.photos.items():
+		meta_object.add_photo(Photo(id=k, data=info))
+
+	for k, description in content.posts.items():
+		meta_object.add_post(Post(id=k, description=description))
+
+	for k, info in content.videos.items():
+		meta_object.add_video(Video(id=k, data=info))
+
+	return meta_object
+
+def scan_ndjson(content_path: str) -> tuple[List[Performer], set[int]]:
+	performers: dict[int, Performer] = {}
+	last_posts: dict[tuple[Optional[int], str], int] = {}
+	superseded: set[int] = set()
+	current: Optional[int] = None
+
+	with open(content_path, 'rb') as ndjson_file:
+
+		for line_number, line in enumerate(ndjson_file):
+
+			if not line.strip():
+				continue
+
+			header = NDJSON_HEADER_DECODER.decode(line)
+
+			if header.type == 'performer':
+				current = header.performer_id
+				performers.setdefault(header.performer_id, Performer(performer=header.performer, performer_id=header.performer_id))
+
+			# PostArchive appends an edited post as a new record, so only the last record of each id is current.
+			elif header.type == 'post':
+				previous = last_posts.get((current, header.id))
+
+				if previous is not None:
+					superseded.add(previous)
+
+				last_posts[(current, header.id)] = line_number
+
+	if not performers:
+		raise ValueError(f'No performer record found in: {content_path}')
+
+	return list(performers.values()), superseded
+
+def iter_ndjson(content_path: str, performer_id: int, skip_lines: AbstractSet[int] = frozenset()) -> Iterator[Item]:
+	current: Optional[int] = None
+
+	with open(content_path, 'rb') as ndjson_file:
+
+		for line_number, line in enumerate(ndjson_file):
+
+			if not line.strip() or line_number in skip_lines:
+				continue
+
+			record = NDJSON_DECODER.decode(line)
+
+			if isinstance(record, Performer):
+				current = record.performer_id
+
+			elif current == performer_id:
+				yield record
+
+def get_local_ndjson(content_path: str) -> List[MetaObject]:
+	meta_objects = []
+
+	performers, superseded = scan_ndjson(content_path)
+
+	for performer in performers:
+		meta_object = MetaObject(performer=performer.performer, performer_id=performer.performer_id, retain=False)
+		meta_object.add_source(iter_ndjson(content_path, performer.performer_id, superseded))
+		meta_objects.append(meta_object)
+
+	return meta_objects
+
+def get_local_hutts(content_paths: List[str], errors: Optional[dict[str, str]] = None) -> List[MetaObject]:
+	meta_objects: dict[int, MetaObject] = {}
+
+	for content_path in content_paths:
+
+		try:
+
+			if content_path.lower().endswith(NDJSON_EXTENSIONS):
+				loaded = get_local_ndjson(content_path)
+
+			else:
+				loaded = [get_local_hutt(content_path)]
+
+		except (KeyError, FileNotFoundError, json.JSONDecodeError, msgspec.DecodeError, ValueError) as e:
+
+			if errors is None:
+				raise
+
+			logging.error(f'{content_path}: {type(e).__name__}: {e}')
+			errors[content_path] = f'{type(e).__name__}: {e}'
+			continue
+
+		for meta_object in loaded:
+
+			if meta_object.performer_id in meta_objects:
+				meta_objects[meta_object.performer_id].merge(meta_object)
+
+			else:
+				meta_objects[meta_object.performer_id] = meta_object
+
+	return list(meta_objects.values())
+
+def parse_page(content: bytes) -> BeautifulSoup:
+	from bs4 import BeautifulSoup, SoupStrainer
+
+	parse_only = SoupStrainer('div', id=POST_SUBTREES) if get_config().restrict_parse else None
+
+	return BeautifulSoup(content, get_config().html_parser, parse_only=parse_only)
+
+def index_page(soup: BeautifulSoup) -> PageIndex:
+	from bs4 import Tag
+
+	page = PageIndex(soup=soup)
+	# Depth-first in document order, carrying the hash of the enclosing post modal down to its videos.
+	stack: List[tuple[Tag, Optional[str]]] = [(soup, None)]
+
+	while stack:
+		tag, modal_hash = stack.pop()
+
+		if tag.name == 'img':
+			page.images.append(tag)
+
+		elif tag.name == 'video':
+
+			if modal_hash:
+				page.videos.append((modal_hash, tag))
+
+		elif 'eventwrap' in tag.get('class', []) and tag.get('data-post-hash'):
+
+			# Photos resolve their hash through the image's parent, so every ancestor maps to its first eventwrap.
+			for ancestor in tag.parents:
+				page.event_wraps.setdefault(id(ancestor), tag['data-post-hash'])
+
+		elif tag.name == 'div':
+			tag_id = tag.get('id') or ''
+
+			if tag_id.startswith('post-modal-'):
+				modal_hash = tag_id.replace('post-modal-', '', 1)
+				page.modals.setdefault(modal_hash, tag)
+
+			elif tag_id.startswith('grid-carousel-'):
+				page.carousels.append((tag_id.replace('grid-carousel-', '', 1), tag))
+
+			elif tag_id.startswith('post-') and 'huttPost' in tag.get('class', []):
+				page.posts.append((tag_id.replace('post-', ''), tag))
+
+		stack.extend((child, modal_hash) for child in reversed(tag.contents) if isinstance(child, Tag))
+
+	return page
+
+def put_item(items: 'queue.Queue[Optional[List[Item]]]', unit: Optional[List[Item]], stop: threading.Event) -> bool:
+
+	while not stop.is_set():
+
+		try:
+			items.put(unit, timeout=1)
+
+			return True
+
+		except queue.Full:
+			continue
+
+	return False
+
+def paginate(meta_object: MetaObject, perf_id: int, media_type: str, headers: dict[str, str], items: 'queue.Queue[Optional[List[Item]]]', stop: threading.Event, incremental: bool = False, page: int = 0, journal: Optional[JobJournal] = None) -> None:
+	import requests
+
+	limiter = get_limiter('ajax')
+	cache = get_page_cache()
+	pool = get_parse_pool()
+	depth = max(1, get_config().parse_depth) if pool else 0
+	max_retries = max(1, get_config().max_retries)
+	attempt = 0
+	pending: collections.deque[tuple[int, str, Optional[str], Optional[str], Optional[str], Union[List[Item], Future[List[ItemRow]]]]] = collections.deque()
+
+	def publish(page_number: int, extracted: List[Item]) -> bool:
+		new_items = 0
+
+		# A post's photos are queued as one unit, so the other paginator threads cannot split them apart.
+		for _, group in itertools.groupby(extracted, key=lambda item: item.id.split('-')[0]):
+			unit = [item for item in group if meta_object.add(item)]
+
+			if not unit:
+				continue
+
+			new_items += len(unit)
+
+			if journal:
+
+				with journal.buffer_lock:
+
+					for item in unit:
+						journal.write(item)
+
+			if not put_item(items, unit, stop):
+
+				return False
+
+		last = incremental and not new_items
+
+		if journal:
+			journal.write(PageDone(media=media_type, page=page_number, last=last))
+
+		if last:
+			logging.info(f'No new {media_type} on page {page_number}, stopping')
+
+			return False
+
+		return True
+
+	def drain(limit: int) -> bool:
+
+		while len(pending) > limit:
+			page_number, ajax_url, etag, last_modified, body_hash, parsed = pending.popleft()
+
+			if isinstance(parsed, Future):
+
+				with METRICS.time('parse.pool_wait'):
+					extracted = [row_to_item(row) for row in parsed.result()]
+
+			else:
+				extracted = parsed
+
+			if cache and body_hash:
+				METRICS.count('page_cache.misses')
+				cache.put(ajax_url, etag, last_modified, body_hash, extracted)
+
+			if not publish(page_number, extracted):
+
+				return False
+
+		return True
+
+	try:
+
+		while not stop.is_set():
+			ajax_url = f'{get_config().base_url}/hutts/ajax-posts?page={page}&view={media_type}&id={perf_id}'
+			cached = cache.get(ajax_url) if cache else None
+			request_headers = dict(headers)
+
+			if cached and cached.etag:
+				request_headers['If-None-Match'] = cached.etag
+
+			if cached and cached.last_modified:
+				request_headers['If-Modified-Since'] = cached.last_modified
+
+			limiter.acquire()
+			started = time.monotonic()
+
+			try:
+
+				with METRICS.time('ajax.fetch'):
+					r = get_transport().get(ajax_url, headers=request_headers)
+
+			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+				limiter.observe(None)
+				METRICS.count('retries.ajax')
+				attempt += 1
+
+				if attempt < max_retries:
+					continue
+
+				raise
+
+			throttled = limiter.observe(r.status_code, r.headers.get('Retry-After'), time.monotonic() - started)
+
+			if throttled and attempt < max_retries - 1:
+				METRICS.count('retries.ajax')
+				attempt += 1
+				logging.warning(f'{ajax_url} - Status code: {r.status_code} - Retrying, attempt {attempt + 1} out of {max_retries}')
+				continue
+
+			r.raise_for_status()
+			page += 1
+			attempt = 0
+			body_hash = page_hash(r.content) if r.status_code != 304 else None
+
+			if r.status_code != 304 and r.content == b'':
+
+				if not drain(0):
+
+					return
+
+				if journal:
+					journal.write(PageDone(media=media_type, page=page - 1, last=True))
+
+				break
+
+			logging.info(f'{ajax_url} - Status code: {r.status_code} - Rate: {limiter.rate:.2f} requests per second')
+
+			if cache and cached and (r.status_code == 304 or cached.body_hash == body_hash):
+				METRICS.count('page_cache.hits')
+				cache.touch(ajax_url)
+				parsed: Union[List[Item], Future[List[ItemRow]]] = cached.decode_items()
+				body_hash = None
+
+			elif pool:
+				parsed = pool.submit(parse_rows, r.content, media_type)
+
+			else:
+				parsed = parse_items(r.content, media_type)
+
+			pending.append((page - 1, ajax_url, r.headers.get('ETag'), r.headers.get('Last-Modified'), body_hash, parsed))
+
+			if not drain(depth):
+
+				return
+
+	finally:
+		put_item(items, None, stop)
+
+def parse_items(content: bytes, media_type: str) -> List[Item]:
+
+	with METRICS.time('parse.soup'):
+		soup = parse_page(content)
+
+	with METRICS.time('parse.index'):
+		page_index = index_page(soup)
+
+	with METRICS.time(f'extract.{media_type}'):
+		return EXTRACTORS[media_type](page_index)
+
+def item_to_row(item: Item) -> ItemRow:
+
+	if isinstance(item, Post):
+		return (0, item.id, item.description)
+
+	return (1 if isinstance(item, Photo) else 2, item.id, item.data.url, item.data.description)
+
+def row_to_item(row: ItemRow) -> Item:
+
+	if row[0] == 0:
+		return Post(id=row[1], description=row[2])
+
+	return (Photo if row[0] == 1 else Video)(id=row[1], data=Info(url=row[2], description=row[3]))
+
+def parse_rows(content: bytes, media_type: str) -> List[ItemRow]:
+	return [item_to_row(item) for item in parse_items(content, media_type)]
+
+@functools.cache
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+	from concurrent.futures import ProcessPoolExecutor
+	import multiprocessing
+
+	workers = get_config().parse_workers
+
+	if workers == 0:
+		return None
+
+	if __name__ == '__main__' and __spec__ is not None:
+		# Spawned workers skip re-running a package __main__, so publish parse_rows under its importable module name.
+		sys.modules.setdefault(__spec__.name, sys.modules[__name__])
+		parse_rows.__module__ = __spec__.name
+
+	return ProcessPoolExecutor(max_workers=workers if workers > 0 else os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+
+def get_hutt(meta_object: MetaObject, perf_id: int,  performer: str, base_url: str, skip_posts: bool = False, skip_photos: bool = False, skip_videos: bool = False, incremental: bool = False, journal: Optional[JobJournal] = None, resume: Optional[JournalState] = None) -> Iterator[Item]:
+	media_types = [m for m, skip in (('photos', skip_photos), ('videos', skip_videos), ('view', skip_posts)) if not skip and not (resume and m in resume.finished)]
+	items: 'queue.Queue[Optional[List[Item]]]' = queue.Queue(maxsize=max(1, get_config().queue_size))
+	stop = threading.Event()
+
+	if not media_types:
+		return
+
+	with ThreadPoolExecutor(max_workers=len(media_types)) as executor:
+		futures = []
+
+		for m in media_types:
+			referer = f'{base_url}/{performer}' if m == 'view' else f'{base_url}/{performer}/{m}'
+			headers = {'Referer': referer, 'User-Agent': get_user_agent()}
+			start_page = resume.pages.get(m, 0) if resume else 0
+			futures.append(executor.submit(paginate, meta_object, perf_id, m, headers, items, stop, incremental, start_page, journal))
+
+		try:
+			running = len(futures)
+
+			while running:
+				unit = items.get()
+
+				if unit is None:
+					running -= 1
+					continue
+
+				yield from unit
+
+		finally:
+			stop.set()
+
+		for future in futures:
+			future.result()
+
+def get_posts_data(page: PageIndex) -> List[Post]:
+	from bs4 import Tag
+
+	posts: List[Post] = []
+
+	for dynamic_id, post_div in page.posts:
+		post_text_element = post_div.find(class_='post-text')
+
+		if isinstance(post_text_element, Tag):
+			posts.append(Post(id=dynamic_id, description=detect_text(post_text_element)))
+
+	return posts
+
+def get_imgs_data(page: PageIndex) -> List[Photo]:
+	photos: List[Photo] = []
+	base_url = get_config().base_url
+
+	for dynamic_id, grid_div in page.carousels:
+		post_text = page.post_text(dynamic_id)
+
+		for carousel in grid_div.find_all('div', class_='carousel-inner'):
+
+			for idx, ele in enumerate(carousel.find_all('img')):
+				src = ele.get('src') or ele.get('data-src')
+
+				if src:
+					photos.append(Photo(id=f'{dynamic_id}-{idx+1}', data=Info(url=f'{base_url}{src.replace("/middle", "")}', description=post_text)))
+
+	for ele in page.images:
+		dynamic_id = page.event_wraps.get(id(ele.parent))
+		src = ele.get('src') or ele.get('data-src')
+
+		if dynamic_id and src and '/middle' in src:
+			photos.append(Photo(id=dynamic_id, data=Info(url=f'{base_url}{src.replace("/middle", "")}', description=page.post_text(dynamic_id))))
+
+	return photos
+
+def get_vids_data(page: PageIndex) -> List[Video]:
+	from bs4 import Tag
+
+	videos: List[Video] = []
+	base_url = get_config().base_url
+
+	for dynamic_id, ele in page.videos:
+		source = ele.find('source')
+
+		if isinstance(source, Tag):
+			src = f'{base_url}{source.get("src")}'
+			videos.append(Video(id=dynamic_id, data=Info(url=src.replace('/middle', ''), description=page.post_text(dynamic_id))))
+
+	return videos
+
+EXTRACTORS = types.MappingProxyType({'photos': get_imgs_data, 'videos': get_vids_data, 'view': get_posts_data})
+
+def get_state_path(performer: str) -> str:
+	return os.path.join(get_config().save_path, performer, '.huttpy-state.json')
+
+def load_state(performer: str) -> dict[str, List[Any]]:
+	state_path = get_state_path(performer)
+
+	if not os.path.isfile(state_path):
+		return {'posts': [], 'photos': [], 'videos': [], 'failed': []}
+
+	with open(state_path, 'r', encoding='utf8') as json_file:
+		state = json.load(json_file)
+
+	loaded: dict[str, List[Any]] = {k: list(state.get(k, [])) for k in ('posts', 'photos', 'videos')}
+	loaded['failed'] = msgspec.convert(state.get('failed', []), List[Union[Photo, Video]])
+
+	return loaded
+
+def save_state(performer: str, state: dict[str, List[Any]], meta_object: MetaObject, failed: Iterable[Item] = ()) -> None:
+	failed_items = [item for item in failed if isinstance(item, (Photo, Video))]
+	failed_ids = {item.id for item in failed_items}
+	# Earlier failures that were not retried this run (e.g. with --skip-videos) stay queued.
+	seen = set(itertools.chain(meta_object.item_ids('photos'), meta_object.item_ids('videos')))
+	new_state = {
+		'posts': state['posts'] + meta_object.item_ids('posts'),
+		'photos': state['photos'] + [i for i in meta_object.item_ids('photos') if i not in failed_ids],
+		'videos': state['videos'] + [i for i in meta_object.item_ids('videos') if i not in failed_ids]
+	}
+	state_path = get_state_path(performer)
+	os.makedirs(os.path.dirname(state_path), exist_ok=True)
+	save_json({
+		**{k: list(dict.fromkeys(v)) for k, v in new_state.items()},
+		'failed': list({item.id: item for item in itertools.chain((i for i in state['failed'] if i.id not in seen), failed_items)}.values())
+	}, state_path)
+
+class PostArchive:
+	"""Append-only NDJSON archive of post texts that only writes new or edited posts."""
+
+	def __init__(self, performer: str, performer_id: int) -> None:
+		self.path = os.path.join(get_config().save_path, performer, f'{performer}.posts.ndjson')
+		self.known: dict[str, str] = {}
+		self.writer = NdjsonWriter(self.path)
+		self.added = 0
+
+		if os.path.isfile(self.path):
+
+			for post in iter_ndjson(self.path, performer_id):
+
+				if isinstance(post, Post):
+					self.known[post.id] = post.description
+
+			return
+
+		self.writer.write(Performer(performer=performer, performer_id=performer_id))
+		legacy_path = os.path.join(get_config().save_path, performer, f'{performer}.json')
+
+		if os.path.isfile(legacy_path):
+
+			with open(legacy_path, 'rb') as json_file:
+
+				for post_id, description in msgspec.json.decode(json_file.read(), type=dict[str, str]).items():
+					self.add(Post(id=post_id, description=description))
+
+			logging.info(f'Imported {self.added} posts from: {legacy_path}')
+
+	def add(self, post: Post) -> None:
+
+		if self.known.get(post.id) == post.description:
+			return
+
+		self.known[post.id] = post.description
+		self.writer.write(post)
+		self.added += 1
+
+	def close(self) -> None:
+		self.writer.flush()
+
+		if self.added:
+			logging.info(f'Saved {self.added} posts to: {self.path}')
+
+@METRICS.time('write.stream')
+def write_stream(response: Response, path: str, append: bool = False, digest: Optional['hashlib._Hash'] = None) -> int:
+	written = 0
+	disk_seconds = 0.0
+
+	with open(path, 'ab' if append else 'wb') as f:
+
+		for chunk in response.iter_content(chunk_size=max(1, get_config().chunk_size)):
+			started = time.perf_counter()
+			f.write(chunk)
+			disk_seconds += time.perf_counter() - started
+			written += len(chunk)
+
+			if digest is not None:
+				digest.update(chunk)
+
+	METRICS.observe('write.disk', disk_seconds)
+
+	return written
+
+def download_post_photos(photos: List[Photo], fnames: List[str], performer: str, limiter: AdaptiveLimiter, manifest: DownloadManifest) -> List[bool]:
+	results = []
+
+	for photo, fname in zip(photos, fnames):
+
+		try:
+			results.append(download_photo(photo, performer, fname, limiter, manifest))
+
+		except Exception as e:
+			logging.error(f'Photo {photo.id} raised {type(e).__name__}: {e}')
+			results.append(False)
+
+	return results
+
+@METRICS.time('download.photos')
+def download_photo(photo: Photo, performer: str, fname: str, limiter: AdaptiveLimiter, manifest: DownloadManifest) -> bool:
+	import requests
+
+	config = get_config()
+	output_path = os.path.join(config.save_path, performer, 'Images', f'{fname}.jpg')
+	part_path = f'{output_path}.part'
+	max_retries = max(1, config.max_retries)
+	headers = {'Referer': f'{config.base_url}/{performer}/photos'}
+	entry = reuse_download(manifest, 'photos', photo, output_path)
+
+	if entry is None and manifest.owner(output_path) not in (None, ('photos', photo.id)):
+		logging.error(f'Refusing to replace {output_path}, the manifest assigns it to photo: {manifest.owner(output_path)[1]}')
+
+		return False
+
+	if entry is not None:
+
+		if not config.revalidate_downloads:
+			return True
+
+		if entry.etag:
+			headers['If-None-Match'] = entry.etag
+
+		if entry.last_modified:
+			headers['If-Modified-Since'] = entry.last_modified
+
+	for attempt in range(max_retries):
+		limiter.acquire()
+		offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+		digest = hashlib.sha256()
+		started = time.monotonic()
+		throttled = False
+
+		try:
+
+			with METRICS.time('transfer.photos'), make_request(photo.data.url, referer=headers if not offset else {'Referer': headers['Referer']}, stream=True, range_start=offset) as s:
+				throttled = limiter.observe(s.status_code, s.headers.get('Retry-After'), time.monotonic() - started)
+				content_range = s.headers.get('Content-Range', '')
+
+				if s.status_code == 304 and entry is not None:
+					logging.info(f'Photo {photo.id} not modified, skipping')
+
+					return True
+
+				if s.status_code == 416 and offset:
+
+					if content_range.rpartition('/')[2] != str(offset):
+						os.remove(part_path)
+						continue
+
+					file_digest(part_path, digest)
+
+				else:
+					s.raise_for_status()
+					resume = s.status_code == 206 and content_range.startswith(f'bytes {offset}-')
+
+					if offset and resume:
+						logging.info(f'Resuming photo {photo.id} from byte: {offset}')
+						file_digest(part_path, digest)
+
+					METRICS.count('bytes.photos', write_stream(s, part_path, append=resume, digest=digest))
+
+			os.replace(part_path, output_path)
+			manifest.record(ManifestEntry(
+				media='photos', item_id=photo.id, url=photo.data.url, path=output_path, size=os.path.getsize(output_path),
+				etag=s.headers.get('ETag'), last_modified=s.headers.get('Last-Modified'), sha256=digest.hexdigest()
+			))
+			logging.info(f'Downloaded photo with hash: {photo.id}')
+
+			return True
+
+		except (requests.exceptions.RequestException, OSError) as e:
+			logging.warning(f'Attempt {attempt + 1} failed for photo {photo.id}: {e}')
+
+			if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+				throttled = limiter.observe(None)
+
+			if attempt < max_retries - 1:
+				METRICS.count('retries.photos')
+
+			if attempt < max_retries - 1 and not throttled:
+				retry_seconds = config.retry_backoff * 2 ** attempt
+				METRICS.count('sleep_seconds.retry', retry_seconds)
+				logging.info(f'Retrying photo {photo.id} in: {retry_seconds} seconds')
+				time.sleep(retry_seconds)
+
+	logging.error(f'Failed to download photo {photo.id} after {max_retries} attempts')
+
+	return False
+
+def find_video_file(directory: str, fname: str) -> Optional[str]:
+	prefix = f'{fname}.'
+
+	for name in sorted(os.listdir(directory)):
+
+		if name.startswith(prefix) and not name.endswith(('.part', '.ytdl', '.temp')) and '.part-Frag' not in name:
+			return os.path.join(directory, name)
+
+	return None
+
+@METRICS.time('video.yt_dlp')
+def run_yt_dlp(yt_dlp_args: List[str], video_id: str) -> int:
+
+	if not get_config().yt_dlp_in_process:
+		return subprocess.run(['yt-dlp', *yt_dlp_args], check=False).returncode
+
+	import yt_dlp
+
+	def progress_hook(status: dict[str, object]) -> None:
+
+		if status.get('status') == 'finished':
+			logging.info(f'Video {video_id} transferred: {status.get("downloaded_bytes") or status.get("total_bytes")} bytes')
+
+	parsed_options = yt_dlp.parse_options(yt_dlp_args)
+	ydl_opts = parsed_options.ydl_opts
+	ydl_opts.update({'quiet': True, 'noprogress': True, 'progress_hooks': [progress_hook]})
+
+	try:
+
+		with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+			return int(ydl.download(parsed_options.urls))
+
+	except yt_dlp.utils.DownloadError as e:
+		logging.warning(f'yt-dlp failed for video {video_id}: {e}')
+
+		return 1
+
+@METRICS.time('download.videos')
+def download_video(video: Video, performer: str, fname: str, manifest: DownloadManifest) -> int:
+	import shutil
+	import tempfile
+
+	config = get_config()
+	directory = os.path.join(config.save_path, performer, 'Videos')
+	limiter = get_limiter('video')
+	entry = manifest.get('videos', video.id)
+
+	if entry is not None and reuse_download(manifest, 'videos', video, os.path.join(directory, f'{fname}{os.path.splitext(entry.path)[1]}')):
+		return 0
+
+	existing = find_video_file(directory, fname) if os.path.isdir(directory) else None
+	owner = manifest.owner(existing) if existing else None
+
+	if owner not in (None, ('videos', video.id)):
+		logging.error(f'Refusing to replace {existing}, the manifest assigns it to video: {owner[1]}')
+
+		return 1
+
+	logging.info(f'Downloading video with hash: {video.id}')
+
+	# yt-dlp writes its cookie jar back when it exits, so each job gets a private copy and the user's file is never rewritten.
+	with tempfile.TemporaryDirectory(prefix='huttpy-cookies-') as cookies_dir:
+		yt_dlp_args = [
+			video.data.url,
+			'--abort-on-unavailable-fragments',
+			'--hls-prefer-native',
+			'--retries', '100',
+			'--retry-sleep', '4',
+			'--concurrent-fragments', str(max(1, config.video_fragments)),
+			'--user-agent', get_user_agent(),
+			'--referer', f'{config.base_url}/{performer}/videos',
+			'--cookies', shutil.copy(COOKIES_PATH, cookies_dir),
+			'-o', os.path.normpath(os.path.join(directory, f'{fname}.%(ext)s'))
+		]
+
+		limiter.acquire()
+		returncode = run_yt_dlp(yt_dlp_args, video.id)
+
+	limiter.observe(200 if returncode == 0 else None)
+	output_path = find_video_file(directory, fname) if returncode == 0 else None
+
+	if output_path:
+		METRICS.count('bytes.videos', os.path.getsize(output_path))
+		manifest.record(ManifestEntry(
+			media='videos', item_id=video.id, url=video.data.url, path=output_path, size=os.path.getsize(output_path), sha256=file_digest(output_path).hexdigest()
+		))
+
+	elif returncode == 0:
+		returncode = 1
+
+	return returncode
+
+class VideoScheduler:
+	"""Runs yt-dlp jobs in parallel and re-queues failed videos at the back of the queue."""
+
+	def __init__(self, performer: str, manifest: DownloadManifest, names: FilenameRegistry, journal: Optional[JobJournal] = None) -> None:
+		self.performer = performer
+		self.manifest = manifest
+		self.names = names
+		self.journal = journal
+		self.pool = ThreadPoolExecutor(max_workers=max(1, get_config().video_concurrency))
+		self.lock = threading.Condition()
+		self.pending = 0
+		self.submitted = 0
+		self.exit_codes: dict[str, int] = {}
+		self.failed: List[Video] = []
+
+	def submit(self, video: Video) -> 'Future[int]':
+
+		with self.lock:
+			self.pending += 1
+			self.submitted += 1
+
+		return self.pool.submit(self.run, video, 0)
+
+	def run(self, video: Video, attempt: int) -> int:
+		started = time.monotonic()
+
+		try:
+			returncode = download_video(video, self.performer, self.names.name('videos', video), self.manifest)
+
+		except Exception as e:
+			logging.error(f'Video {video.id} raised {type(e).__name__}: {e}')
+			returncode = -1
+
+		logging.info(f'Video {video.id} finished with exit code {returncode} in {time.monotonic() - started:.1f} seconds')
+
+		if returncode != 0 and attempt < get_config().video_retries:
+			logging.warning(f'Re-queueing video {video.id}, attempt {attempt + 2} out of {get_config().video_retries + 1}')
+			METRICS.count('retries.videos')
+			self.pool.submit(self.run, video, attempt + 1)
+
+			return returncode
+
+		if self.journal:
+			self.journal.write(ItemDone(media='videos', id=video.id, ok=returncode == 0))
+
+		with self.lock:
+			self.exit_codes[video.id] = returncode
+
+			if returncode != 0:
+				self.failed.append(video)
+
+			self.pending -= 1
+			self.lock.notify_all()
+
+		return returncode
+
+	def join(self) -> List[Video]:
+
+		with self.lock:
+
+			while self.pending:
+				self.lock.wait()
+
+		self.pool.shutdown()
+
+		return self.failed
+
+def download_items(items: Iterable[Item], meta_object: MetaObject, performer: str, skip_posts: bool = False, skip_photos: bool = False, skip_videos: bool = False, journal: Optional[JobJournal] = None) -> List[Item]:
+	limiter = get_limiter()
+	slots = threading.BoundedSemaphore(max(1, get_config().queue_size))
+	photo_futures: List[tuple[List[Photo], Future[List[bool]]]] = []
+	group: List[Photo] = []
+
+	def release(_: Future[int]) -> None:
+		slots.release()
+
+	def photos_done(photos: List[Photo], future: Future[List[bool]]) -> None:
+		slots.release()
+
+		if journal:
+
+			for photo, ok in zip(photos, future.result()):
+				journal.write(ItemDone(media='photos', id=photo.id, ok=ok))
+
+	def submit_group() -> None:
+
+		if not group:
+			return
+
+		if not photo_futures:
+			make_dirs(performer, 1, 0)
+
+		photos = group.copy()
+		group.clear()
+		slots.acquire()
+		future = photo_pool.submit(download_post_photos, photos, [names.name('photos', p) for p in photos], performer, limiter, manifest)
+		photo_futures.append((photos, future))
+		future.add_done_callback(functools.partial(photos_done, photos))
+
+	os.makedirs(os.path.join(get_config().save_path, performer), exist_ok=True)
+	manifest = DownloadManifest(get_manifest_path(performer))
+	names = FilenameRegistry(performer, manifest)
+	scheduler = VideoScheduler(performer, manifest, names, journal)
+	archive = PostArchive(performer, meta_object.performer_id) if not skip_posts else None
+
+	try:
+
+		with ThreadPoolExecutor(max_workers=max(1, get_config().max_concurrency)) as photo_pool:
+
+			for item in items:
+
+				if isinstance(item, Photo) and not skip_photos:
+
+					if group and group[0].id.split('-')[0] != item.id.split('-')[0]:
+						submit_group()
+
+					group.append(item)
+					continue
+
+				submit_group()
+
+				if isinstance(item, Video) and not skip_videos:
+
+					if not scheduler.submitted:
+						make_dirs(performer, 0, 1)
+
+					slots.acquire()
+					names.name('videos', item)
+					scheduler.submit(item).add_done_callback(release)
+
+				elif isinstance(item, Post) and archive:
+					archive.add(item)
+
+			submit_group()
+
+	finally:
+		failed_videos: List[Item] = list(scheduler.join())
+		manifest.close()
+
+		if archive:
+			archive.close()
+
+	failed_photos: List[Item] = [p for photos, f in photo_futures for p, ok in zip(photos, f.result()) if not ok]
+	total_photos = sum(len(photos) for photos, _ in photo_futures)
+	logging.info(f'Downloaded {total_photos - len(failed_photos)} photos and {scheduler.submitted - len(failed_videos)} videos for: {performer}')
+
+	if failed_photos or failed_videos:
+		logging.warning(f'{len(failed_photos)} photos and {len(failed_videos)} videos failed to download for: {performer}')
+
+		for v in failed_videos:
+			logging.warning(f'Video {v.id} exit code: {scheduler.exit_codes.get(v.id)}')
+
+	return failed_photos + failed_videos
+
+def get_id(soup: BeautifulSoup) -> int:
+	from bs4 import Tag
+
+	id_element = soup.find('input', {'type': 'hidden', 'name': 'id'})
+
+	if isinstance(id_element, Tag):
+		id_value = id_element.get('value')
+
+		if isinstance(id_value, str):
+
+			return int(id_value)
+
+	raise ValueError("id not found or is not a valid integer")
+
+def get_last_segment(url: str) -> str:
+	parsed_url = urlparse(url)
+
+	return parsed_url.path.replace('/', '')
+
+def test_cookies(soup: BeautifulSoup) -> bool:
+	sign_up = soup.find(class_='sign-up')
+	have_account = soup.find(class_='have-account') 
+
+	if sign_up or have_account:
+		return True
+
+	return False
+
+def read_batch(path: str) -> List[str]:
+
+	if path == '-':
+		lines = sys.stdin.read().splitlines()
+
+	else:
+
+		with open(path, 'r', encoding='utf8') as batch_file:
+			lines = batch_file.read().splitlines()
+
+	return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+def get_output_path(output: str, performer: str) -> str:
+	filename = f'huttpy-Dict-{performer}-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.json'
+
+	if os.path.isfile(output):
+		return output
+
+	if os.path.isdir(output):
+		return os.path.join(output, filename)
+
+	full_path = os.path.join(os.path.expanduser('~'), 'Desktop', filename)
+	logging.warning(f'Path does not exist, defaulting to: {full_path}')
+
+	return full_path
+
+def get_ndjson_path(ndjson: str, performer: str) -> str:
+
+	if os.path.isdir(ndjson):
+		return os.path.join(ndjson, f'huttpy-{performer}-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.ndjson')
+
+	return ndjson
+
+def process_performer(target: Union[str, MetaObject], args: argparse.Namespace) -> None:
+	from bs4 import BeautifulSoup
+	from rich import print_json
+
+	state = None
+	journal = None
+	failed: List[Item] = []
+	retry: List[Item] = []
+
+	if isinstance(target, MetaObject):
+		meta_object = target
+		meta_object.retain = args.json
+		performer, perf_id = meta_object.performer, meta_object.performer_id
+		logging.info(f'Processing: {performer}')
+		items = meta_object.iter_items()
+
+	else:
+		logging.info(f'Processing: {target}')
+		performer = get_last_segment(target)
+		journal_path = get_journal_path(performer)
+		resume = load_journal(journal_path) if args.resume and os.path.isfile(journal_path) else None
+
+		if resume and resume.performer:
+			perf_id = resume.performer.performer_id
+			logging.info(f'Resuming from journal with {len(resume.items)} items and {len(resume.done)} finished downloads: {journal_path}')
+
+		else:
+			resume = None
+			r = make_request(target, referer=None)
+			r.raise_for_status()
+			soup = BeautifulSoup(r.content, 'html.parser')
+			bad_cookies = test_cookies(soup)
+
+			if bad_cookies:
+				logging.info(f'Location of cookies file: {COOKIES_PATH}')
+
+				raise ValueError('Cannot log in: Cookies expired or invalid.')
+
+			perf_id = get_id(soup)
+
+		meta_object = MetaObject(performer=performer, performer_id=perf_id, retain=args.json or not args.ndjson)
+		state = load_state(performer) if args.incremental else None
+
+		if state:
+			meta_object.mark_known(state['posts'], state['photos'], state['videos'])
+
+		os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+		journal = JobJournal(journal_path)
+
+		if resume:
+
+			for item in resume.items:
+				meta_object.add(item)
+
+		else:
+			open(journal_path, 'wb').close()
+			journal.write(Performer(performer=performer, performer_id=perf_id))
+			journal.flush()
+
+		if state:
+			# Failed downloads sit on pages that --incremental stops before, so queue them directly.
+			skipped = {Photo: args.skip_photos, Video: args.skip_videos}
+			retry = [item for item in state['failed'] if not skipped[type(item)] and meta_object.add(item)]
+
+		items = get_hutt(meta_object, perf_id, performer, get_config().base_url, args.skip_posts, args.skip_photos, args.skip_videos, args.incremental, journal, resume)
+
+		if resume:
+			items = itertools.chain(resume.pending_items(), items)
+
+		if retry:
+			logging.info(f'Retrying {len(retry)} downloads that failed on an earlier run')
+			items = itertools.chain(retry, items)
+
+	if args.ndjson:
+		writer = NdjsonWriter(get_ndjson_path(args.ndjson, performer))
+		writer.write(Performer(performer=performer, performer_id=perf_id))
+		items = stream_ndjson(items, writer)
+
+	store = None
+
+	if args.store or get_config().metadata_store:
+		METADATA_STORE_PATH.parent.mkdir(parents=True, exist_ok=True)
+		store = MetadataStore(METADATA_STORE_PATH)
+		store.add_performer(performer, perf_id)
+		items = stream_store(items, store, perf_id)
+
+	try:
+
+		if args.no_download:
+
+			for _ in items:
+				pass
+
+		else:
+			failed = download_items(items, meta_object, performer, args.skip_posts, args.skip_photos, args.skip_videos, journal)
+
+			if state:
+				save_state(performer, state, meta_object, failed)
+
+			if store:
+				failed_ids = {item.id for item in failed}
+
+				for media, skip in (('photos', args.skip_photos), ('videos', args.skip_videos)):
+
+					if not skip:
+						item_ids = meta_object.item_ids(media)
+						store.mark_downloads(perf_id, media, [i for i in item_ids if i not in failed_ids], 'done')
+						store.mark_downloads(perf_id, media, [i for i in item_ids if i in failed_ids], 'failed')
+
+	finally:
+
+		if journal:
+			journal.flush()
+
+		if store:
+			store.close()
+
+		if args.json:
+			save_json(meta_object.asdict(), get_output_path(args.output, performer), get_config().json_indent)
+
+	if journal and failed:
+		logging.warning(f'Keeping journal for a later --resume: {journal.path}')
+
+	elif journal:
+		os.remove(journal.path)
+
+	print_json(data={'performer': performer, 'performer_id': perf_id, 'posts_count': meta_object.count('posts'), 'photos_count': meta_object.count('photos'), 'videos_count': meta_object.count('videos')}, indent=4)
+
+def run_batch(targets: List[Union[str, MetaObject]], args: argparse.Namespace, errors: dict[str, str]) -> List[str]:
+	concurrency = args.performers if args.performers is not None else get_config().performer_concurrency
+	succeeded: List[str] = []
+
+	with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(targets) or 1))) as executor:
+		futures = {executor.submit(process_performer, t, args): t.performer if isinstance(t, MetaObject) else t for t in targets}
+
+		for future in as_completed(futures):
+			label = futures[future]
+
+			try:
+				future.result()
+				succeeded.append(label)
+
+			except Exception as e:
+				logging.error(f'{label}: {type(e).__name__}: {e}')
+				errors[label] = f'{type(e).__name__}: {e}'
+
+	return succeeded
+
+def save_metrics(args: argparse.Namespace) -> None:
+
+	if args.metrics == '-':
+		print(json.dumps(METRICS.summary(), indent=4))
+
+	elif args.metrics:
+
+		with open(args.metrics, 'w', encoding=DEFAULT_ENCODING) as metrics_file:
+			json.dump(METRICS.summary(), metrics_file, indent=4)
+
+	if args.prometheus:
+		temp_path = f'{args.prometheus}.tmp'
+
+		with open(temp_path, 'w', encoding=DEFAULT_ENCODING) as prometheus_file:
+			prometheus_file.write(METRICS.prometheus())
+
+		os.replace(temp_path, args.prometheus)
+
+class ThreadProfiler:
+	"""cProfile for the calling thread and every thread started while it runs, merged on save."""
+
+	# From 3.12 cProfile sits on sys.monitoring, which sees every thread and refuses a second active profiler.
+	per_thread = sys.version_info < (3, 12)
+
+	def __init__(self) -> None:
+		self.lock = threading.Lock()
+		self.profilers: List[cProfile.Profile] = []
+
+	def start(self) -> None:
+
+		if self.per_thread:
+			threading.setprofile(self.start_thread)
+
+		self.start_thread()
+
+	def start_thread(self, *args: object) -> None:
+		import cProfile
+
+		sys.setprofile(None)
+		profiler = cProfile.Profile()
+
+		with self.lock:
+			self.profilers.append(profiler)
+
+		profiler.enable()
+
+	def stop(self) -> None:
+
+		if self.per_thread:
+			threading.setprofile(None)
+
+		self.profilers[0].disable()
+
+	def save(self, path: str) -> None:
+		import io
+		import pstats
+
+		stream = io.StringIO()
+		stats = pstats.Stats(*self.profilers, stream=stream)
+		stats.dump_stats(path)
+		stats.sort_stats('cumulative').print_stats(25)
+		logging.info(f'Profile of {len(self.profilers)} threads saved to: {path}')
+		print(stream.getvalue(), file=sys.stderr)
+
+def run_huttpy(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+	from http.cookiejar import LoadError
+	from rich import print_json
+
+	sources: List[str] = list(args.url)
+	errors: dict[str, str] = {}
+
+	if args.batch == '-' and not args.no_download and not args.no_prompts:
+		parser.error('--batch - reads stdin, which the download prompt needs too: add --no-prompts or --no-download')
+
+	if args.batch:
+
+		try:
+			sources.extend(read_batch(args.batch))
+
+		except OSError as e:
+			logging.error(f'{type(e).__name__}: {e}')
+			sys.exit(1)
+
+	if not sources:
+		parser.error('at least one url or --batch is required')
+
+	try:
+		get_transport()
+
+	except (FileNotFoundError, LoadError):
+		sys.exit(1)
+
+	targets: List[Union[str, MetaObject]] = list(sources)
+
+	if args.load_dict:
+		targets = list(get_local_hutts(sources, errors))
+
+	if not args.no_download and not args.no_prompts:
+		input('Press Enter to start downloading')
+
+	succeeded = run_batch(targets, args, errors)
+
+	if len(sources) > 1:
+		print_json(data={'succeeded': succeeded, 'failed': errors}, indent=4)
+
+	if errors:
+		sys.exit(1)
+
+def query_store(args: argparse.Namespace) -> None:
+	db_path = args.db or METADATA_STORE_PATH
+
+	if not os.path.isfile(db_path):
+		logging.error(f'No metadata store found at: {db_path}')
+		sys.exit(1)
+
+	connection = sqlite3.connect(f'{pathlib.Path(db_path).as_uri()}?mode=ro', uri=True)
+	performers = connection.execute('SELECT performer_id, performer FROM performers ORDER BY performer').fetchall()
+
+	if args.performers:
+		wanted = set(args.performers)
+		performers = [(i, name) for i, name in performers if name in wanted or str(i) in wanted]
+
+	out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+	encoder = msgspec.json.Encoder()
+	buffer = bytearray()
+
+	try:
+
+		if args.media == 'performers':
+
+			for performer_id, performer in performers:
+				counts = connection.execute(
+					'SELECT (SELECT COUNT(*) FROM posts WHERE performer_id = :id), (SELECT COUNT(*) FROM photos WHERE performer_id = :id), '
+					'(SELECT COUNT(*) FROM videos WHERE performer_id = :id), '
+					"(SELECT COUNT(*) FROM downloads WHERE performer_id = :id AND status = 'done'), (SELECT COUNT(*) FROM downloads WHERE performer_id = :id AND status = 'failed')",
+					{'id': performer_id}
+				).fetchone()
+
+				if args.format == 'table':
+					buffer.extend(f'{performer}\t{performer_id}\tposts={counts[0]}\tphotos={counts[1]}\tvideos={counts[2]}\tdownloaded={counts[3]}\tfailed={counts[4]}\n'.encode())
+
+				else:
+					encoder.encode_into(Performer(performer=performer, performer_id=performer_id), buffer, -1)
+					buffer.extend(b'\n')
+
+			out.write(buffer)
+
+			return
+
+		media_types = ['photos', 'videos'] if args.media == 'media' else [args.media]
+
+		for performer_id, performer in performers:
+
+			if args.format == 'ndjson':
+				encoder.encode_into(Performer(performer=performer, performer_id=performer_id), buffer, -1)
+				buffer.extend(b'\n')
+
+			for media in media_types:
+				columns = 'i.id, i.description' if media == 'posts' else 'i.id, i.url, i.description'
+				query = f'SELECT {columns} FROM {media} i'
+				conditions = ['i.performer_id = :id']
+
+				if media != 'posts' and (args.pending or args.failed):
+					query += ' LEFT JOIN downloads d ON d.performer_id = i.performer_id AND d.media = :media AND d.item_id = i.id'
+					conditions.append("d.status = 'failed'" if args.failed else "(d.status IS NULL OR d.status != 'done')")
+
+				if args.post:
+					conditions.append('i.post_id = :post' if media == 'photos' else 'i.id = :post')
+
+				for row in connection.execute(f'{query} WHERE {" AND ".join(conditions)} ORDER BY i.rowid', {'id': performer_id, 'media': media, 'post': args.post}):
+					item = Post(id=row[0], description=row[1]) if media == 'posts' else (Photo if media == 'photos' else Video)(id=row[0], data=Info(url=row[1], description=row[2]))
+
+					if args.format == 'ndjson':
+						encoder.encode_into(item, buffer, -1)
+						buffer.extend(b'\n')
+
+					elif args.format == 'urls':
+
+						if not isinstance(item, Post):
+							buffer.extend(f'{item.data.url}\n'.encode())
+
+					else:
+						buffer.extend(f'{performer}\t{media[:-1]}\t{item.id}\t{item.description if isinstance(item, Post) else item.data.url}\n'.encode())
+
+					if len(buffer) >= 1 << 16:
+						out.write(buffer)
+						buffer.clear()
+
+		out.write(buffer)
+
+	finally:
+		out.flush()
+		connection.close()
+
+		if out is not sys.stdout.buffer:
+			out.close()
+
+def main() -> None:
+
+	if sys.argv[1:2] == ['query']:
+		configure_logging()
+		query_store(parse_query().parse_args(sys.argv[2:]))
+
+		return
+
+	parser = parse_huttpy()
+	args = parser.parse_args(sys.argv[1:])
+	configure_logging()
+	profiler = None
+
+	if args.profile:
+		profiler = ThreadProfiler()
+		profiler.start()
+
+	try:
+		run_huttpy(parser, args)
+
+	finally:
+
+		if profiler:
+			profiler.stop()
+			profiler.save(args.profile)
+
+		save_metrics(args)
 
 if __name__ == '__main__':
 	main()
\ No newline at end of file